@@ -0,0 +1,249 @@
+"""
+Admission control for the expensive endpoints.
+
+Each budget caps how many requests run at once and how many may wait for a
+slot. A request is turned away straight away with 503 (or 429) and a
+Retry-After header when the wait queue is full or its expected wait is longer
+than the budget's max_wait, and after max_wait if it is still waiting, so
+a load spike gets fast rejections rather than piling up threads, kernels and
+GDAL connections.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# 503 (overloaded) or 429 (too many requests) for rejected requests
+ADMISSION_REJECT_STATUS = int(os.getenv("ADMISSION_REJECT_STATUS", "503"))
+# Upper bound on the Retry-After estimate, in seconds
+ADMISSION_RETRY_AFTER_MAX = int(os.getenv("ADMISSION_RETRY_AFTER_MAX", "60"))
+
+# Weight of the newest request in the moving average of slot hold times
+HOLD_TIME_SMOOTHING = 0.2
+
+admission_wait_seconds = histogram(
+    "admission_wait_seconds",
+    "Time admitted requests waited for a slot",
+    ["budget"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+admission_rejections = counter(
+    "admission_rejections",
+    "Requests turned away by admission control",
+    ["budget", "reason"],
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request isn't admitted."""
+
+    def __init__(self, budget: str, reason: str, retry_after: int):
+        super().__init__(f"{budget} is overloaded ({reason})")
+        self.budget = budget
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionBudget:
+    """
+    A concurrency limit with a bounded FIFO wait queue, for one event loop.
+
+    Slots are handed straight to the next waiter on release, so a waiter can't
+    be overtaken by a request arriving later.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_time: Optional[float] = None
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "expected_wait": 0, "timeout": 0}
+
+    def expected_wait(self) -> Optional[float]:
+        """Estimated seconds a new arrival would wait, once hold times are known."""
+        if self._hold_time is None:
+            return None
+        ahead = len(self._waiters) + 1
+        return self._hold_time * ahead / self.concurrency
+
+    def retry_after(self) -> int:
+        wait = self.expected_wait()
+        if wait is None:
+            wait = self.max_wait
+        return max(1, min(ADMISSION_RETRY_AFTER_MAX, math.ceil(wait)))
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the seconds waited. Raises AdmissionRejected."""
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full")
+        expected = self.expected_wait()
+        if expected is not None and expected > self.max_wait:
+            self._reject("expected_wait")
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait([waiter], timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # The client went away; give back a slot that was just handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            self._reject("timeout")
+        self.admitted += 1
+        return time.monotonic() - start
+
+    def release(self, held: Optional[float] = None) -> None:
+        """Free a slot, handing it to the longest waiter if there is one."""
+        if held is not None:
+            self._hold_time = (
+                held
+                if self._hold_time is None
+                else HOLD_TIME_SMOOTHING * held
+                + (1 - HOLD_TIME_SMOOTHING) * self._hold_time
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget": self.name,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "utilization": round(self._active / self.concurrency, 3),
+            "hold_time_avg": round(self._hold_time, 4) if self._hold_time else None,
+            "admitted": self.admitted,
+            # Exported on /metrics by the admission_rejections counter
+            "rejected": dict(self.rejected),
+        }
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        admission_rejections.inc(budget=self.name, reason=reason)
+        raise AdmissionRejected(self.name, reason, self.retry_after())
+
+
+def _budget_from_env(name: str, concurrency: int, max_queue: int, max_wait: float):
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionBudget(
+        name,
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT", str(max_wait))),
+    )
+
+
+# QLR reads hold an executor thread and GDAL connections; notebook runs hold
+# config lookups, prepares and, for batches, kernels
+admission_budgets = {
+    "qlr": _budget_from_env("qlr", concurrency=16, max_queue=64, max_wait=5),
+    "notebook": _budget_from_env("notebook", concurrency=8, max_queue=32, max_wait=10),
+}
+
+# Request paths counted against each budget
+ADMISSION_ROUTES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^/qlr(/batch)?/?$"), "qlr"),
+    (re.compile(r"^/run/notebook/[^/]+(/batch)?/?$"), "notebook"),
+]
+
+
+def budget_for_path(
+    path: str, routes: List[Tuple[re.Pattern, str]] = ADMISSION_ROUTES
+) -> Optional[AdmissionBudget]:
+    for pattern, name in routes:
+        if pattern.match(path):
+            return admission_budgets[name]
+    return None
+
+
+def admission_stats() -> List[Dict[str, Any]]:
+    return [budget.stats() for budget in admission_budgets.values()]
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the admission budgets to matching requests."""
+
+    def __init__(self, app, enabled: bool = ADMISSION_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        budget = None
+        if scope["type"] == "http" and self.enabled:
+            budget = budget_for_path(scope["path"])
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            waited = await budget.acquire()
+        except AdmissionRejected as e:
+            logger.warning(
+                f"Rejected {scope['method']} {scope['path']}: {e}, "
+                f"retry after {e.retry_after}s"
+            )
+            await self._reject(send, e)
+            return
+
+        admission_wait_seconds.observe(waited, budget=budget.name)
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.release(time.monotonic() - start)
+
+    @staticmethod
+    async def _reject(send, rejected: AdmissionRejected) -> None:
+        body = json.dumps({"detail": str(rejected)}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": ADMISSION_REJECT_STATUS,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(rejected.retry_after).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,88 @@
+"""
+Compare HTTP requests, bytes fetched and latency per COG header read with GDAL's
+defaults and with the tuned environment from create_qlr.gdal_env.
+
+Each profile runs in a fresh process so GDAL's caches start cold.
+
+    python benchmarks/cog_header_reads.py URL [URL ...] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROFILES = {"default": "false", "tuned": "true"}
+
+
+def run_profile(urls, repeat):
+    sys.path.insert(0, str(ROOT))
+    from create_qlr.create_qlr import read_cog_metadata
+    from create_qlr.gdal_env import count_http_requests
+
+    results = []
+    for attempt in range(repeat):
+        for url in urls:
+            start = time.perf_counter()
+            with count_http_requests() as counter:
+                read_cog_metadata(url)
+            results.append(
+                {
+                    "pass": attempt + 1,
+                    "url": url,
+                    "requests": counter.requests,
+                    "bytes": counter.bytes,
+                    "seconds": time.perf_counter() - start,
+                }
+            )
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("urls", nargs="+", help="COG URLs to read")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the URLs")
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args.urls, args.repeat)
+        return
+
+    print(f"{'profile':<8} {'pass':>4} {'requests':>9} {'bytes':>10} {'ms/read':>8}")
+    for profile, enabled in PROFILES.items():
+        env = {**os.environ, "COG_GDAL_ENV_ENABLED": enabled}
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                *args.urls,
+                "--repeat",
+                str(args.repeat),
+                "--profile",
+                profile,
+            ],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+
+        for attempt in range(1, args.repeat + 1):
+            reads = [r for r in results if r["pass"] == attempt]
+            requests = sum(r["requests"] for r in reads) / len(reads)
+            fetched = sum(r["bytes"] for r in reads) / len(reads)
+            millis = 1000 * sum(r["seconds"] for r in reads) / len(reads)
+            print(
+                f"{profile:<8} {attempt:>4} {requests:>9.1f} "
+                f"{fetched:>10.0f} {millis:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
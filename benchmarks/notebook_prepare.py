@@ -0,0 +1,89 @@
+"""
+Compare preparing a parameterized notebook with papermill (prepare_only) and
+with the cached in-memory parameterizer from run_notebook.parameterize.
+
+Both outputs are checked to be identical apart from the random id nbformat
+gives the injected-parameters cell.
+
+    python benchmarks/notebook_prepare.py NOTEBOOK [-p name=value ...] [--runs 50]
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import papermill as pm  # noqa: E402
+
+from run_notebook.parameterize import prepare_notebook  # noqa: E402
+
+CELL_ID_RE = re.compile(r'"id": "[0-9a-f-]+"')
+
+
+def prepare_with_papermill(path, output_path, parameters, kernel_name):
+    pm.execute_notebook(
+        path,
+        output_path,
+        parameters=parameters,
+        prepare_only=True,
+        kernel_name=kernel_name,
+        progress_bar=False,
+    )
+
+
+def time_runs(prepare, path, output_path, parameters, kernel_name, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        prepare(path, output_path, parameters, kernel_name)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings
+
+
+def without_injected_id(text):
+    # Only the injected cell is new, so it is the only id that differs
+    return CELL_ID_RE.sub('"id": ""', text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("notebook", help="source notebook path or URL")
+    parser.add_argument(
+        "-p", "--parameter", action="append", default=[], help="name=value"
+    )
+    parser.add_argument("--kernel", default="python3", help="kernel name")
+    parser.add_argument("--runs", type=int, default=50, help="runs per method")
+    args = parser.parse_args()
+
+    parameters = dict(p.split("=", 1) for p in args.parameter)
+    methods = {"papermill": prepare_with_papermill, "in-memory": prepare_notebook}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = {}
+        print(f"{'method':<10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, prepare in methods.items():
+            output_path = str(Path(tmp) / f"{name}.ipynb")
+            timings = time_runs(
+                prepare, args.notebook, output_path, parameters, args.kernel, args.runs
+            )
+            outputs[name] = Path(output_path).read_text(encoding="utf-8")
+            p50 = 1000 * timings[len(timings) // 2]
+            p95 = 1000 * timings[int(len(timings) * 0.95) - 1]
+            print(f"{name:<10} {p50:>8.2f} {p95:>8.2f} {1000 * timings[-1]:>8.2f}")
+
+    # The output path is recorded in the notebook metadata
+    expected, actual = (
+        without_injected_id(text).replace(f"{name}.ipynb", "output.ipynb")
+        for name, text in outputs.items()
+    )
+    print("outputs identical:", expected == actual)
+
+
+if __name__ == "__main__":
+    main()
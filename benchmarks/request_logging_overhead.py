@@ -0,0 +1,177 @@
+"""
+Measure the per-request overhead of request logging: the old BaseHTTPMiddleware
+log_requests against the ASGI RequestLoggingMiddleware from request_logging.
+
+Requests are driven straight through the ASGI app, without a server, against a
+trivial endpoint. Log output goes to a temporary file so the file writes are
+part of the cost.
+
+    python benchmarks/request_logging_overhead.py [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import PlainTextResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+import request_logging  # noqa: E402
+from request_logging import (  # noqa: E402
+    TEXT_FORMAT,
+    RequestLoggingMiddleware,
+    configure_logging,
+    stop_logging,
+)
+
+logger = logging.getLogger("main")
+
+
+async def log_requests(request: Request, call_next):
+    """The request logging middleware as it was before request_logging.py"""
+    if not os.getenv("LOG_REQUESTS", "true").lower() == "true":
+        return await call_next(request)
+
+    start_time = time.time()
+    client_ip = request.client.host if request.client else "unknown"
+    user_agent = request.headers.get("user-agent", "unknown")
+    logger.info(
+        f"Request started: {request.method} {request.url.path} "
+        f"from {client_ip} (User-Agent: {user_agent})"
+    )
+    if request.query_params:
+        logger.debug(f"Query params: {dict(request.query_params)}")
+    if os.getenv("LOG_REQUEST_BODY", "false").lower() == "true" and request.method in [
+        "POST",
+        "PUT",
+        "PATCH",
+    ]:
+        body = await request.body()
+        if body:
+            logger.debug(f"Request body: {body.decode('utf-8')[:500]}...")
+
+    response = await call_next(request)
+    process_time = time.time() - start_time
+    status_emoji = "✅" if 200 <= response.status_code < 300 else "❌"
+    logger.info(
+        f"Request completed: {request.method} {request.url.path} "
+        f"-> {response.status_code} {status_emoji} in {process_time:.3f}s"
+    )
+    response.headers["X-Process-Time"] = str(round(process_time, 3))
+    return response
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+def endpoint_app():
+    return Starlette(routes=[Route("/items/{item_id}", ok)])
+
+
+def configure_direct(log_file):
+    # The old setup: basicConfig writing on the request's thread
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(log_file)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def variants(log_file):
+    yield "no logging", lambda: configure_direct(log_file), endpoint_app()
+    yield (
+        "log_requests (before)",
+        lambda: configure_direct(log_file),
+        BaseHTTPMiddleware(endpoint_app(), dispatch=log_requests),
+    )
+    yield (
+        "ASGI + queue, text",
+        lambda: configure_logging("INFO", "text", log_file),
+        RequestLoggingMiddleware(endpoint_app(), enabled=True, sample_rate=1),
+    )
+    yield (
+        "ASGI + queue, json",
+        lambda: configure_logging("INFO", "json", log_file),
+        RequestLoggingMiddleware(endpoint_app(), enabled=True, sample_rate=1),
+    )
+    yield (
+        "ASGI + queue, 1% sampled",
+        lambda: configure_logging("INFO", "text", log_file),
+        RequestLoggingMiddleware(endpoint_app(), enabled=True, sample_rate=0.01),
+    )
+
+
+async def drive(app, requests):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/items/42",
+        "raw_path": b"/items/42",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"user-agent", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--requests", type=int, default=20000, help="requests per variant"
+    )
+    args = parser.parse_args()
+
+    # Only the request logs are measured
+    request_logging.logger.setLevel(logging.INFO)
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as log_file:
+        baseline = None
+        print(f"{'variant':<26} {'us/request':>10} {'overhead':>10}")
+        for name, configure, app in variants(log_file):
+            configure()
+            asyncio.run(drive(app, 200))
+            seconds = asyncio.run(drive(app, args.requests))
+            # Include writing out whatever is still queued
+            flush_start = time.perf_counter()
+            stop_logging()
+            seconds += time.perf_counter() - flush_start
+
+            per_request = 1e6 * seconds / args.requests
+            if baseline is None:
+                baseline = per_request
+            print(f"{name:<26} {per_request:>10.1f} {per_request - baseline:>+10.1f}")
+
+    configure_direct(sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
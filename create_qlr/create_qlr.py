@@ -1,81 +1,339 @@
 import rasterio
 from rasterio.warp import transform_bounds
-from create_qlr.get_template import get_template_path
+from create_qlr.gdal_env import count_http_requests, ensure_gdal_env
+from create_qlr.get_template import CompiledTemplate, template_registry
+from create_qlr.metadata_cache import cog_metadata_cache, cog_negative_cache
+from create_qlr.metadata_store import (
+    COG_METADATA_STORE_REVALIDATE,
+    cog_metadata_store,
+    fetch_validators,
+)
+from create_qlr.singleflight import SingleFlight
+from create_qlr.stac import load_stac_item, metadata_from_stac
 import os
+import re
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from typing import Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+import time
+from contextlib import nullcontext
+from metrics import counter, histogram
+from tracing import span, traced
+
+try:
+    # rasterio.errors doesn't export GDAL's error classes; if the private module
+    # changes, failures are classified by their messages alone
+    from rasterio._err import (
+        CPLE_AWSBucketNotFoundError,
+        CPLE_AWSObjectNotFoundError,
+        CPLE_BaseError,
+    )
+except ImportError:
+    CPLE_BaseError = None
 
 logger = logging.getLogger(__name__)
 
+# Count GDAL's HTTP requests and bytes per header read, for the metrics and the
+# read_cog_metadata trace span; this turns on GDAL debug logging for the read,
+# so it is off by default
+COG_METRICS_HTTP_REQUESTS = (
+    os.getenv("COG_METRICS_HTTP_REQUESTS", "false").lower() == "true"
+)
+
+cog_metadata_lookup_seconds = histogram(
+    "cog_metadata_lookup_seconds",
+    "get_cog_metadata latency by where the metadata came from",
+    ["source"],
+)
+cog_header_read_seconds = histogram(
+    "cog_header_read_seconds", "COG header read latency", ["result"]
+)
+cog_http_requests = counter(
+    "cog_http_requests", "HTTP requests made by GDAL for COG header reads"
+)
+cog_http_bytes = counter("cog_http_bytes", "Bytes fetched by GDAL for COG header reads")
+qlr_template_render_seconds = histogram(
+    "qlr_template_render_seconds",
+    "QLR template render time",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
+QLR_DOCTYPE = "<!DOCTYPE qgis-layer-definition>"
+XML_ATTR_ENTITIES = {'"': "&quot;"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# GDAL reports failed /vsicurl requests as "HTTP response code: 404"; refused
+# connections, DNS failures and timeouts come through as curl errors instead
+HTTP_STATUS_RE = re.compile(r"HTTP response code: (\d{3})")
+# Client errors that can succeed on a later attempt
+RETRYABLE_HTTP_STATUSES = frozenset({408, 425, 429})
+NOT_A_TIFF_MESSAGE = "not recognized as being in a supported file format"
+
+# Concurrent metadata reads for the same COG share a single network read
+cog_metadata_flights = SingleFlight()
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a COG URL for use as a cache key: lower-case scheme and host,
+    drop default ports and fragments. Paths and query strings are left as-is.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ""
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username or parts.password:
+        userinfo = parts.username or ""
+        if parts.password is not None:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    return urlunsplit((scheme, netloc, parts.path, parts.query, ""))
+
 
 def get_cog_metadata(url: str) -> Dict[str, Any]:
     """
-    Reads a COG's metadata from a given URL.
-    Returns a dictionary with extent, wgs84_extent, crs info, width, height, band count, and dtype.
+    Get a COG's metadata, serving repeat lookups from the in-process metadata cache
+    and coalescing concurrent lookups of the same URL into one read.
+    Returns a dictionary with extent, wgs84_extent, crs info, width, height,
+    band count, and dtype.
     """
+    start = time.perf_counter()
+    key = normalize_url(url)
+    with span("get_cog_metadata", **{"cog.url": _url_without_query(key)}) as current:
+        metadata = cog_metadata_cache.get(key)
+        if metadata is not None:
+            logger.debug(f"COG metadata cache hit for {url}")
+            _observe_lookup(start, "memory", current)
+            return metadata
+
+        failure = cog_negative_cache.get(key)
+        if failure is not None:
+            logger.debug(f"COG negative cache hit for {url}")
+            _observe_lookup(start, "negative", current)
+            raise ValueError(failure[1])
+
+        try:
+            metadata = cog_metadata_flights.do(
+                key, _read_and_cache_cog_metadata, key, url
+            )
+        finally:
+            _observe_lookup(start, "loaded", current)
+        return dict(metadata)
+
+
+def _observe_lookup(start: float, source: str, current: Any) -> None:
+    cog_metadata_lookup_seconds.observe(time.perf_counter() - start, source=source)
+    current.set_attribute("cog.metadata_source", source)
+
+
+def _url_without_query(url: str) -> str:
+    # Query strings can carry signed credentials, which don't belong in traces
+    return url.split("?", 1)[0]
+
+
+def _read_and_cache_cog_metadata(key: str, url: str) -> Dict[str, Any]:
     try:
-        with rasterio.open(url) as src:
-            bounds = src.bounds
-            crs = src.crs
-            width = src.width
-            height = src.height
-            count = src.count
-            dtype = src.dtypes[0]
-
-            # Transform bounds to WGS84
-            wgs84_bounds = transform_bounds(crs, "EPSG:4326", *bounds)
-
-            metadata = {
-                "extent": bounds,
-                "wgs84_extent": wgs84_bounds,
-                "crs_wkt": crs.to_wkt() if crs else None,
-                "crs_proj4": crs.to_proj4() if crs else None,
-                "crs_epsg": crs.to_epsg() if crs else None,
-                "width": width,
-                "height": height,
-                "count": count,
-                "dtype": dtype,
-            }
-
-            logger.info(f"Successfully read COG metadata from {url}")
+        return _read_through_store(key, url)
+    except ValueError as e:
+        # Remember definite failures briefly so broken links fail fast
+        error_class = _permanent_error_class(e)
+        if error_class is not None:
+            cog_negative_cache.put(key, error_class, str(e))
+        raise
+
+
+def _gdal_error(error: BaseException) -> Optional[BaseException]:
+    # rasterio raises its own error while handling GDAL's, so follow both links
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if CPLE_BaseError is not None:
+            if isinstance(error, CPLE_BaseError):
+                return error
+        elif HTTP_STATUS_RE.search(str(error)) or NOT_A_TIFF_MESSAGE in str(error):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _permanent_error_class(error: Exception) -> Optional[str]:
+    """
+    The class of a failure that retrying won't fix: an HTTP 4xx other than
+    timeouts and rate limiting, a missing S3 object or bucket, or a file that
+    isn't a TIFF. Returns None for anything that may be transient.
+    """
+    gdal_error = _gdal_error(error)
+    if gdal_error is None:
+        return None
+
+    message = str(gdal_error)
+    match = HTTP_STATUS_RE.search(message)
+    if match is not None:
+        status = int(match.group(1))
+        if 400 <= status < 500 and status not in RETRYABLE_HTTP_STATUSES:
+            return f"{type(gdal_error).__name__}({status})"
+        return None
+    if CPLE_BaseError is not None and isinstance(
+        gdal_error, (CPLE_AWSObjectNotFoundError, CPLE_AWSBucketNotFoundError)
+    ):
+        return type(gdal_error).__name__
+    if NOT_A_TIFF_MESSAGE in message:
+        return type(gdal_error).__name__
+    return None
+
+
+def _read_through_store(key: str, url: str) -> Dict[str, Any]:
+    if not cog_metadata_store.enabled:
+        metadata = read_cog_metadata(url)
+        cog_metadata_cache.put(key, metadata)
+        return metadata
+
+    # Read through the persistent store shared by all workers
+    validators = None
+    stored = cog_metadata_store.get(key)
+    if stored is not None:
+        metadata, stored_validators, fresh = stored
+        if fresh:
+            cog_metadata_cache.put(key, metadata)
             return metadata
 
-    except rasterio.RasterioIOError as e:
-        logger.error(f"Failed to read COG from {url}: {e}")
-        raise ValueError(f"Invalid or inaccessible COG URL: {url}")
-    except Exception as e:
-        logger.error(f"Unexpected error reading COG metadata: {e}")
-        raise ValueError(f"Error processing COG: {str(e)}")
+        if COG_METADATA_STORE_REVALIDATE:
+            validators = fetch_validators(url)
+            if validators is not None and validators == stored_validators:
+                logger.debug(f"Stored COG metadata for {url} is still valid")
+                cog_metadata_store.touch(key)
+                cog_metadata_cache.put(key, metadata)
+                return metadata
+
+    # A cold miss is stored without validators rather than paying for a HEAD
+    # next to GDAL's read; they are fetched when the entry first expires, and
+    # that first revalidation re-reads the header
+    metadata = read_cog_metadata(url)
+    cog_metadata_store.put(key, metadata, validators)
+    cog_metadata_cache.put(key, metadata)
+    return metadata
+
+
+def resolve_metadata(
+    url: str, stac_item: Optional[Union[Dict[str, Any], str, Path]] = None
+) -> Dict[str, Any]:
+    """
+    Get a COG's metadata from its STAC item when one is given and carries the
+    projection fields, otherwise from the COG header.
+    """
+    if stac_item is not None:
+        metadata = metadata_from_stac(load_stac_item(stac_item), url)
+        if metadata is not None:
+            return metadata
+        logger.info(f"STAC item incomplete for {url}, reading COG header")
+
+    return get_cog_metadata(url)
 
 
+def read_cog_metadata(url: str) -> Dict[str, Any]:
+    """
+    Reads a COG's metadata from a given URL.
+    Returns a dictionary with extent, wgs84_extent, crs info, width, height, band count, and dtype.
+    """
+    ensure_gdal_env()
+    start = time.perf_counter()
+    result = "error"
+    http = None
+    counting = count_http_requests() if COG_METRICS_HTTP_REQUESTS else nullcontext()
+    with span("read_cog_metadata", **{"cog.url": _url_without_query(url)}) as current:
+        try:
+            with counting as http, rasterio.open(url) as src:
+                bounds = src.bounds
+                crs = src.crs
+                width = src.width
+                height = src.height
+                count = src.count
+                dtype = src.dtypes[0]
+
+                # Transform bounds to WGS84
+                wgs84_bounds = transform_bounds(crs, "EPSG:4326", *bounds)
+
+                metadata = {
+                    "extent": bounds,
+                    "wgs84_extent": wgs84_bounds,
+                    "crs_wkt": crs.to_wkt() if crs else None,
+                    "crs_proj4": crs.to_proj4() if crs else None,
+                    "crs_epsg": crs.to_epsg() if crs else None,
+                    "width": width,
+                    "height": height,
+                    "count": count,
+                    "dtype": dtype,
+                }
+
+                logger.info(f"Successfully read COG metadata from {url}")
+                result = "ok"
+                return metadata
+
+        except rasterio.RasterioIOError as e:
+            logger.error(f"Failed to read COG from {url}: {e}")
+            raise ValueError(f"Invalid or inaccessible COG URL: {url}") from e
+        except Exception as e:
+            logger.error(f"Unexpected error reading COG metadata: {e}")
+            raise ValueError(f"Error processing COG: {str(e)}") from e
+        finally:
+            cog_header_read_seconds.observe(time.perf_counter() - start, result=result)
+            if http is not None:
+                cog_http_requests.inc(http.requests)
+                cog_http_bytes.inc(http.bytes)
+                current.set_attributes(
+                    {"gdal.http_requests": http.requests, "gdal.http_bytes": http.bytes}
+                )
+
+
+@traced()
 def generate_qlr(
     metadata: Dict[str, Any],
     url: str,
     layer_id: str,
     layer_name: Optional[str] = None,
     template_path: Optional[str] = None,
+    template: Optional[CompiledTemplate] = None,
 ) -> str:
     """
-    Generate QLR XML from metadata and template.
+    Generate QLR XML from metadata and a compiled template, or a template file
+    when no compiled template is given.
     """
-    if not template_path or not Path(template_path).exists():
+    if template is None and (not template_path or not Path(template_path).exists()):
         raise ValueError("Template path is required and must exist")
 
     if layer_name is None:
         layer_name = os.path.basename(url)
 
     try:
-        with open(template_path, "r") as f:
-            template = f.read()
+        if template is None:
+            with open(template_path, "r") as f:
+                template = CompiledTemplate(f.read())
 
         extent = metadata["extent"]
         wgs84_extent = metadata["wgs84_extent"]
 
-        qlr_xml = template.format(
-            datasource=f"/vsicurl/{url}",
-            layer_id=layer_id,
-            layer_name=layer_name,
+        render_start = time.perf_counter()
+        qlr_xml = template.render(
+            datasource=escape(f"/vsicurl/{url}", XML_ATTR_ENTITIES),
+            layer_id=escape(layer_id, XML_ATTR_ENTITIES),
+            layer_name=escape(layer_name, XML_ATTR_ENTITIES),
             xmin=extent.left,
             ymin=extent.bottom,
             xmax=extent.right,
@@ -88,6 +346,7 @@ def generate_qlr(
             crs_proj4=metadata["crs_proj4"],
             crs_epsg=metadata["crs_epsg"] if metadata["crs_epsg"] is not None else "",
         )
+        qlr_template_render_seconds.observe(time.perf_counter() - render_start)
 
         logger.info(f"Successfully generated QLR for {url}")
         return qlr_xml
@@ -110,9 +369,99 @@ def write_qlr_file(qlr_text: str, output_path: str) -> None:
         raise ValueError(f"Error writing QLR file: {str(e)}")
 
 
-def create_qlr(url: str, collection: str) -> str:
+def merge_qlrs(qlr_docs: List[str]) -> str:
+    """
+    Merge single-layer QLR documents into one QLR with a layer-tree-layer and
+    maplayer entry per input document, in input order.
+    """
+    if not qlr_docs:
+        raise ValueError("At least one QLR document is required")
+
+    try:
+        roots = [ET.fromstring(doc) for doc in qlr_docs]
+    except ET.ParseError as e:
+        logger.error(f"Failed to parse QLR for merging: {e}")
+        raise ValueError(f"Error merging QLR: {str(e)}")
+
+    merged = roots[0]
+    layer_tree_group = merged.find("layer-tree-group")
+    maplayers = merged.find("maplayers")
+    if layer_tree_group is None or maplayers is None:
+        raise ValueError("Error merging QLR: template has no layer tree or map layers")
+
+    for root in roots[1:]:
+        layer_tree_group.extend(root.iterfind("layer-tree-group/layer-tree-layer"))
+        maplayers.extend(root.iterfind("maplayers/maplayer"))
+
+    return f"{QLR_DOCTYPE}\n{ET.tostring(merged, encoding='unicode')}"
+
+
+def qlr_etag(
+    metadata: Dict[str, Any],
+    url: str,
+    collection: str,
+    layer_id: str,
+    template_version: Optional[str] = None,
+) -> str:
+    """
+    Strong ETag for a rendered QLR: a hash of the template version and every
+    input that ends up in the document.
+    """
+    extent = metadata["extent"]
+    parts = (
+        template_version or template_registry.version,
+        collection,
+        url,
+        layer_id,
+        tuple(extent),
+        tuple(metadata["wgs84_extent"]),
+        metadata["crs_wkt"],
+        metadata["crs_proj4"],
+        metadata["crs_epsg"],
+    )
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def cached_qlr_etag(
+    url: str, collection: str, layer_id: Optional[str] = None
+) -> Optional[str]:
+    """
+    ETag of the QLR for url and collection if its COG metadata and templates are
+    already loaded, without any I/O, so it's safe to call on the event loop.
+    Returns None when either would need loading.
+
+    Only peeks at the caches: a request that falls through to build_qlr is
+    counted once, by its own lookup.
+    """
+    url = url.strip()
+    collection = collection.strip()
+    metadata = cog_metadata_cache.peek(normalize_url(url))
+    if metadata is None:
+        return None
+
+    template_version = template_registry.peek_version(collection)
+    if template_version is None:
+        return None
+
+    layer_id = layer_id or os.path.basename(url)
+    return qlr_etag(metadata, url, collection, layer_id, template_version)
+
+
+@traced()
+def build_qlr(
+    url: str,
+    collection: str,
+    layer_id: Optional[str] = None,
+    stac_item: Optional[Union[Dict[str, Any], str, Path]] = None,
+) -> Tuple[str, str]:
     """
     Create QLR file for given URL and collection with proper error handling.
+    The layer ID defaults to the URL's file name. When a STAC item (dict, inline
+    JSON or file path) is given, its projection fields are used instead of
+    reading the COG header.
+
+    Returns the QLR XML and its ETag.
     """
     try:
         # Validate inputs
@@ -125,19 +474,37 @@ def create_qlr(url: str, collection: str) -> str:
         if not collection.strip():
             raise ValueError("Collection cannot be empty")
 
+        url = url.strip()
+        collection = collection.strip()
+
         # Get metadata
-        metadata = get_cog_metadata(url.strip())
+        metadata = resolve_metadata(url, stac_item)
 
-        # Get template path
-        template_path = get_template_path(collection.strip())
+        # Get compiled template
+        with span("get_template", collection=collection):
+            template = template_registry.get(collection)
 
         # Generate QLR
         layer_name = os.path.basename(url)
-        qlr = generate_qlr(metadata, url, layer_name, layer_name, template_path)
+        layer_id = layer_id or layer_name
+        qlr = generate_qlr(metadata, url, layer_id, layer_name, template=template)
 
         logger.info(f"QLR created successfully for {url} with collection {collection}")
-        return qlr
+        return qlr, qlr_etag(metadata, url, collection, layer_id)
 
     except Exception as e:
         logger.error(f"QLR creation failed: {e}")
         raise
+
+
+def create_qlr(
+    url: str,
+    collection: str,
+    layer_id: Optional[str] = None,
+    stac_item: Optional[Union[Dict[str, Any], str, Path]] = None,
+) -> str:
+    """
+    Create QLR file for given URL and collection. See build_qlr.
+    """
+    qlr, _ = build_qlr(url, collection, layer_id, stac_item)
+    return qlr
@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import rasterio
+
+logger = logging.getLogger(__name__)
+
+# GDAL config options for reading COG headers over /vsicurl. Each can be
+# overridden by an environment variable of the same name.
+DEFAULT_GDAL_OPTIONS = {
+    # Don't list the remote "directory" or probe for sidecar files on open
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff,.TIF,.TIFF",
+    # Skip the HEAD request and fetch the header with the first range request
+    "CPL_VSIL_CURL_USE_HEAD": "NO",
+    # One request big enough to hold the IFDs of an ARD scene
+    "GDAL_INGESTED_BYTES_AT_OPEN": "65536",
+    # Process-wide cache of downloaded blocks and file properties
+    "CPL_VSIL_CURL_CACHE_SIZE": str(64 * 1024 * 1024),
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": str(16 * 1024 * 1024),
+    # Reuse connections across reads
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_TCP_KEEPALIVE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_TIMEOUT": "30",
+    "GDAL_HTTP_MAX_RETRY": "2",
+    "GDAL_HTTP_RETRY_DELAY": "0.5",
+}
+
+COG_GDAL_ENV_ENABLED = os.getenv("COG_GDAL_ENV_ENABLED", "true").lower() == "true"
+
+GDAL_HEADER_READ_OPTIONS = {
+    name: os.getenv(name, default) for name, default in DEFAULT_GDAL_OPTIONS.items()
+}
+
+_local = threading.local()
+
+
+def ensure_gdal_env() -> None:
+    """
+    Enter the tuned rasterio.Env on the calling thread if it isn't active yet.
+
+    The environment is left open for the lifetime of the thread, so executor
+    threads keep one GDAL environment (and its connection and block caches)
+    across requests instead of setting one up per read.
+    """
+    if not COG_GDAL_ENV_ENABLED or getattr(_local, "env", None) is not None:
+        return
+
+    env = rasterio.Env(**GDAL_HEADER_READ_OPTIONS)
+    env.__enter__()
+    _local.env = env
+    logger.debug(
+        f"Entered COG header GDAL environment on {threading.current_thread().name}"
+    )
+
+
+# GDAL debug messages emitted for each /vsicurl HTTP request
+_DOWNLOAD_RE = re.compile(r"Downloading (\d+)-(\d+)")
+_REQUEST_RE = re.compile(r"Downloading |GetFileSize\(|GetFileList\(|Listing ")
+
+
+class HTTPRequestCounter(logging.Handler):
+    """
+    Count the /vsicurl HTTP requests and range bytes GDAL reports in debug logs
+    on the thread that created the counter.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.thread = threading.get_ident()
+        self.requests = 0
+        self.bytes = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread or record.levelno >= logging.WARNING:
+            return
+        message = record.getMessage()
+        if "VSICURL" not in message and "vsicurl" not in message:
+            return
+        if _REQUEST_RE.search(message):
+            self.requests += 1
+        match = _DOWNLOAD_RE.search(message)
+        if match:
+            start, end = map(int, match.groups())
+            self.bytes += end - start + 1
+
+
+class _ForwardHandler(logging.Handler):
+    """
+    Passes on the GDAL records that would have been logged without counting,
+    from every thread, while propagation is off for the debug messages.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger("rasterio").handle(record)
+
+
+# Concurrent counters share the logger settings and one forwarding handler;
+# the last one out restores them
+_counting = {
+    "active": 0,
+    "level": logging.NOTSET,
+    "propagate": True,
+    "forward": None,
+}
+_counting_lock = threading.Lock()
+
+
+@contextmanager
+def count_http_requests() -> Iterator[HTTPRequestCounter]:
+    """
+    Count GDAL's /vsicurl HTTP requests made inside the block.
+
+    GDAL only reports requests with CPL_DEBUG enabled, which is turned on for
+    the duration of the block. The debug messages are kept out of the
+    application logs, but they still cost something to produce.
+    """
+    # The long-lived environment must be the outer one, or leaving this block
+    # would tear it down
+    ensure_gdal_env()
+    counter = HTTPRequestCounter()
+    gdal_logger = logging.getLogger("rasterio._env")
+    with _counting_lock:
+        if not _counting["active"]:
+            _counting["level"] = gdal_logger.level
+            _counting["propagate"] = gdal_logger.propagate
+            if gdal_logger.propagate:
+                _counting["forward"] = _ForwardHandler(
+                    level=gdal_logger.getEffectiveLevel()
+                )
+                gdal_logger.addHandler(_counting["forward"])
+            gdal_logger.setLevel(logging.DEBUG)
+            gdal_logger.propagate = False
+        _counting["active"] += 1
+        gdal_logger.addHandler(counter)
+    try:
+        with rasterio.Env(CPL_DEBUG="ON"):
+            yield counter
+    finally:
+        with _counting_lock:
+            gdal_logger.removeHandler(counter)
+            _counting["active"] -= 1
+            if not _counting["active"]:
+                if _counting["forward"] is not None:
+                    gdal_logger.removeHandler(_counting["forward"])
+                    _counting["forward"] = None
+                gdal_logger.setLevel(_counting["level"])
+                gdal_logger.propagate = _counting["propagate"]
+
+
+def gdal_env_options() -> Dict[str, str]:
+    """The GDAL options applied to COG header reads."""
+    return dict(GDAL_HEADER_READ_OPTIONS) if COG_GDAL_ENV_ENABLED else {}
@@ -1,22 +1,189 @@
 import json
 import os
+import time
+import hashlib
+import logging
+import threading
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
 
+from tracing import traced
+
+logger = logging.getLogger(__name__)
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "template_config.json")
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+# Minimum seconds between checks of the config and template files for changes
+TEMPLATE_RELOAD_INTERVAL = float(os.getenv("TEMPLATE_RELOAD_INTERVAL", "5"))
 
 
-def load_config(config_path):
-    with open(config_path, "r") as f:
-        return json.load(f)
+@traced()
+def get_template_path(collection):
+    return template_registry.get_template_path(collection)
 
 
-def get_template_path_for_collection(collection, config, templates_dir="templates"):
-    # Looks up the template for the given collection in the config
-    template_file = config["collections"][collection]["template"]
-    return os.path.join(os.path.dirname(__file__), templates_dir, template_file)
+class CompiledTemplate:
+    """
+    A str.format style template pre-split into static chunks and placeholder
+    slots, so rendering is a single join instead of a format string parse.
+    """
 
+    def __init__(self, text: str):
+        self._parts: List[str] = []
+        self._slots: List[Tuple[int, str, Optional[str], str]] = []
 
-def get_template_path(collection):
-    config = load_config(CONFIG_PATH)
-    template_path = get_template_path_for_collection(collection, config)
-    return template_path
+        for literal, field_name, format_spec, conversion in Formatter().parse(text):
+            if literal:
+                self._parts.append(literal)
+            if field_name is None:
+                continue
+            if not field_name.isidentifier():
+                raise ValueError(f"Unsupported template placeholder: {{{field_name}}}")
+            self._slots.append(
+                (len(self._parts), field_name, conversion, format_spec or "")
+            )
+            self._parts.append("")
+
+        self.field_names = frozenset(name for _, name, _, _ in self._slots)
+
+    def render(self, **values: Any) -> str:
+        parts = self._parts.copy()
+        for index, field_name, conversion, format_spec in self._slots:
+            value = values[field_name]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "s":
+                value = str(value)
+            elif conversion == "a":
+                value = ascii(value)
+            parts[index] = format(value, format_spec)
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    """
+    Holds a compiled template for every collection in the template config.
+
+    Everything is loaded in one pass and swapped in as a single snapshot, so a
+    reload triggered by a change on disk never exposes a half-loaded registry.
+    """
+
+    def __init__(
+        self,
+        config_path: str = CONFIG_PATH,
+        templates_dir: str = TEMPLATES_DIR,
+        reload_interval: float = TEMPLATE_RELOAD_INTERVAL,
+    ):
+        self.config_path = config_path
+        self.templates_dir = templates_dir
+        self.reload_interval = reload_interval
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Load the config and compile every template, replacing the snapshot."""
+        with self._lock:
+            self._snapshot = self._build_snapshot()
+            self._last_check = time.monotonic()
+        logger.info(
+            f"Loaded {len(self._snapshot['templates'])} QLR templates "
+            f"(version {self._snapshot['version']})"
+        )
+
+    @property
+    def version(self) -> str:
+        """Content hash of the config and all templates."""
+        return self._current()["version"]
+
+    def get(self, collection: str) -> CompiledTemplate:
+        snapshot = self._current()
+        try:
+            return snapshot["templates"][collection]
+        except KeyError:
+            raise ValueError(f"Unknown collection: {collection}")
+
+    def peek_version(self, collection: str) -> Optional[str]:
+        """
+        The loaded version if it has collection, without touching the disk.
+        Returns None before the first load or when a reload check is due.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or collection not in snapshot["templates"]:
+            return None
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            return None
+        return snapshot["version"]
+
+    def get_template_path(self, collection: str) -> str:
+        snapshot = self._current()
+        try:
+            return snapshot["paths"][collection]
+        except KeyError:
+            raise ValueError(f"Unknown collection: {collection}")
+
+    def _current(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.load()
+            return self._snapshot
+
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            self._reload_if_changed(snapshot)
+        return self._snapshot
+
+    def _reload_if_changed(self, snapshot: Dict[str, Any]) -> None:
+        # Only one thread checks; the others keep serving the current snapshot
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            if self._file_signature(snapshot["files"]) == snapshot["signature"]:
+                return
+            self._snapshot = self._build_snapshot()
+            logger.info(f"Reloaded QLR templates (version {self._snapshot['version']})")
+        except Exception as e:
+            logger.error(f"Failed to reload QLR templates, keeping current ones: {e}")
+        finally:
+            self._lock.release()
+
+    def _build_snapshot(self) -> Dict[str, Any]:
+        digest = hashlib.sha256()
+        with open(self.config_path, "rb") as f:
+            config_bytes = f.read()
+        digest.update(config_bytes)
+        config = json.loads(config_bytes)
+
+        templates = {}
+        paths = {}
+        for collection, settings in sorted(config["collections"].items()):
+            path = os.path.join(self.templates_dir, settings["template"])
+            with open(path, "r") as f:
+                text = f.read()
+            digest.update(collection.encode())
+            digest.update(text.encode())
+            templates[collection] = CompiledTemplate(text)
+            paths[collection] = path
+
+        files = [self.config_path, *sorted(set(paths.values()))]
+        return {
+            "templates": templates,
+            "paths": paths,
+            "files": files,
+            "signature": self._file_signature(files),
+            "version": digest.hexdigest()[:16],
+        }
+
+    @staticmethod
+    def _file_signature(files: List[str]) -> Tuple:
+        signature = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,216 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COG_METADATA_CACHE_MAX_ENTRIES = int(
+    os.getenv("COG_METADATA_CACHE_MAX_ENTRIES", "1024")
+)
+COG_METADATA_CACHE_MAX_BYTES = int(
+    os.getenv("COG_METADATA_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+)
+COG_METADATA_CACHE_TTL = float(os.getenv("COG_METADATA_CACHE_TTL", "3600"))
+COG_NEGATIVE_CACHE_MAX_ENTRIES = int(
+    os.getenv("COG_NEGATIVE_CACHE_MAX_ENTRIES", "4096")
+)
+COG_NEGATIVE_CACHE_TTL = float(os.getenv("COG_NEGATIVE_CACHE_TTL", "60"))
+
+
+def estimate_metadata_size(key: str, metadata: Dict[str, Any]) -> int:
+    """Approximate the memory held by a cache entry (the CRS WKT dominates)."""
+    size = sys.getsizeof(key) + sys.getsizeof(metadata)
+    for value in metadata.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, tuple):
+            size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class MetadataCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL, bounded by entry count and by
+    the approximate size of the cached metadata dicts.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached metadata for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, metadata = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(metadata)
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Like get, but leaves the stats and LRU order alone."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return dict(entry[2])
+
+    def put(self, key: str, metadata: Dict[str, Any]) -> None:
+        """Store metadata for key, evicting least recently used entries as needed."""
+        if not self.enabled:
+            return
+
+        size = estimate_metadata_size(key, metadata)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching metadata for {key}: {size} bytes exceeds limit")
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, size, dict(metadata))
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class NegativeCache:
+    """
+    Short-lived LRU cache of failed lookups, remembering the error class and
+    message so repeat requests for a broken URL fail fast with the same error.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+        self.hits_by_class: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (error_class, message) for a recent failure of key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, error_class, message = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self.hits += 1
+            self.hits_by_class[error_class] = self.hits_by_class.get(error_class, 0) + 1
+            return error_class, message
+
+    def put(self, key: str, error_class: str, message: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, error_class, message)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "hits_by_class": dict(self.hits_by_class),
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+cog_metadata_cache = MetadataCache(
+    max_entries=COG_METADATA_CACHE_MAX_ENTRIES,
+    max_bytes=COG_METADATA_CACHE_MAX_BYTES,
+    ttl=COG_METADATA_CACHE_TTL,
+)
+
+cog_negative_cache = NegativeCache(
+    max_entries=COG_NEGATIVE_CACHE_MAX_ENTRIES,
+    ttl=COG_NEGATIVE_CACHE_TTL,
+)
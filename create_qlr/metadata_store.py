@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from rasterio.coords import BoundingBox
+
+logger = logging.getLogger(__name__)
+
+# Empty path disables the store
+COG_METADATA_STORE_PATH = os.getenv(
+    "COG_METADATA_STORE_PATH", ".cache/cog_metadata.sqlite"
+)
+COG_METADATA_STORE_TTL = float(os.getenv("COG_METADATA_STORE_TTL", "86400"))
+COG_METADATA_STORE_MAX_ENTRIES = int(
+    os.getenv("COG_METADATA_STORE_MAX_ENTRIES", "100000")
+)
+# Revalidate expired entries with a HEAD request instead of re-reading the COG.
+# Validators are captured at an entry's first expiry, not on the cold read.
+COG_METADATA_STORE_REVALIDATE = (
+    os.getenv("COG_METADATA_STORE_REVALIDATE", "true").lower() == "true"
+)
+VALIDATOR_TIMEOUT = 10
+# Don't rewrite accessed_at on every hit; LRU order only needs to be roughly right
+ACCESS_UPDATE_INTERVAL = 60
+EVICTION_CHECK_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cog_metadata (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER,
+    metadata TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cog_metadata_accessed_at ON cog_metadata (accessed_at);
+"""
+
+
+def fetch_validators(url: str) -> Optional[Dict[str, Any]]:
+    """
+    HEAD the URL for its ETag, Last-Modified and Content-Length.
+    Returns None if the URL isn't HTTP(S), the request fails or it has no validators.
+    """
+    if not url.lower().startswith(("http://", "https://")):
+        return None
+
+    try:
+        resp = requests.head(url, allow_redirects=True, timeout=VALIDATOR_TIMEOUT)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        logger.debug(f"Could not fetch validators for {url}: {e}")
+        return None
+
+    size = resp.headers.get("Content-Length")
+    validators = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "size": int(size) if size and size.isdigit() else None,
+    }
+    if not any(validators.values()):
+        return None
+    return validators
+
+
+def encode_metadata(metadata: Dict[str, Any]) -> str:
+    return json.dumps(
+        {
+            **metadata,
+            "extent": list(metadata["extent"]),
+            "wgs84_extent": list(metadata["wgs84_extent"]),
+        }
+    )
+
+
+def decode_metadata(data: str) -> Dict[str, Any]:
+    metadata = json.loads(data)
+    metadata["extent"] = BoundingBox(*metadata["extent"])
+    metadata["wgs84_extent"] = tuple(metadata["wgs84_extent"])
+    return metadata
+
+
+class MetadataStore:
+    """
+    COG metadata persisted in a local SQLite database (WAL mode), so that every
+    uvicorn worker and every restart shares previously read COG headers.
+
+    Entries older than the TTL are revalidated against the URL's ETag,
+    Last-Modified and size before being served again. The least recently
+    accessed entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def get(self, url: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], bool]]:
+        """
+        Look up url. Returns (metadata, validators, fresh) or None when not stored.
+        """
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT etag, last_modified, size, metadata, stored_at, accessed_at "
+                "FROM cog_metadata WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            etag, last_modified, size, data, stored_at, accessed_at = row
+            now = time.time()
+            if now - accessed_at >= ACCESS_UPDATE_INTERVAL:
+                conn.execute(
+                    "UPDATE cog_metadata SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+
+            validators = {"etag": etag, "last_modified": last_modified, "size": size}
+            fresh = now - stored_at < self.ttl
+            self._count("hits" if fresh else "misses")
+            return decode_metadata(data), validators, fresh
+        except sqlite3.Error as e:
+            self._count("errors")
+            logger.warning(f"COG metadata store lookup failed for {url}: {e}")
+            return None
+
+    def put(
+        self,
+        url: str,
+        metadata: Dict[str, Any],
+        validators: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        validators = validators or {}
+        now = time.time()
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cog_metadata "
+                "(url, etag, last_modified, size, metadata, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    validators.get("etag"),
+                    validators.get("last_modified"),
+                    validators.get("size"),
+                    encode_metadata(metadata),
+                    now,
+                    now,
+                ),
+            )
+            self._count("writes")
+            self._maybe_evict()
+        except sqlite3.Error as e:
+            self._count("errors")
+            logger.warning(f"COG metadata store write failed for {url}: {e}")
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as freshly validated."""
+        now = time.time()
+        try:
+            self._connection().execute(
+                "UPDATE cog_metadata SET stored_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, url),
+            )
+            self._count("revalidated")
+        except sqlite3.Error as e:
+            self._count("errors")
+            logger.warning(f"COG metadata store update failed for {url}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
+
+    def _maybe_evict(self) -> None:
+        with self._lock:
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction < EVICTION_CHECK_EVERY:
+                return
+            self._writes_since_eviction = 0
+
+        conn = self._connection()
+        (count,) = conn.execute("SELECT COUNT(*) FROM cog_metadata").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+
+        conn.execute(
+            "DELETE FROM cog_metadata WHERE url IN "
+            "(SELECT url FROM cog_metadata ORDER BY accessed_at LIMIT ?)",
+            (excess,),
+        )
+        self._count("evictions", excess)
+        logger.info(f"Evicted {excess} entries from the COG metadata store")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+cog_metadata_store = MetadataStore(
+    path=COG_METADATA_STORE_PATH,
+    ttl=COG_METADATA_STORE_TTL,
+    max_entries=COG_METADATA_STORE_MAX_ENTRIES,
+)
@@ -0,0 +1,114 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.warp import transform_bounds
+
+logger = logging.getLogger(__name__)
+
+
+def load_stac_item(stac_item: Union[Dict[str, Any], str, Path]) -> Dict[str, Any]:
+    """
+    Load a STAC item given as a dict, an inline JSON string or a path to a JSON file.
+    """
+    if isinstance(stac_item, dict):
+        return stac_item
+
+    try:
+        if isinstance(stac_item, str) and stac_item.lstrip().startswith("{"):
+            item = json.loads(stac_item)
+        else:
+            with open(stac_item, "r") as f:
+                item = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load STAC item: {e}")
+        raise ValueError(f"Invalid STAC item: {str(e)}")
+
+    if not isinstance(item, dict):
+        raise ValueError("Invalid STAC item: expected a JSON object")
+    return item
+
+
+def find_asset(item: Dict[str, Any], url: str) -> Optional[Dict[str, Any]]:
+    """Find the item asset whose href is the given URL."""
+    for asset in item.get("assets", {}).values():
+        if isinstance(asset, dict) and asset.get("href", "").strip() == url:
+            return asset
+    return None
+
+
+def metadata_from_stac(item: Dict[str, Any], url: str) -> Optional[Dict[str, Any]]:
+    """
+    Build the COG metadata dict from the STAC projection extension fields of the
+    asset matching url (falling back to the item properties).
+
+    Returns None when the CRS, extent or shape can't be determined, so the caller
+    can fall back to reading the COG header.
+    """
+    asset = find_asset(item, url) or {}
+    properties = item.get("properties", {})
+
+    def field(name: str) -> Any:
+        return asset.get(name, properties.get(name))
+
+    try:
+        epsg = field("proj:epsg")
+        crs = _stac_crs(epsg, field("proj:wkt2"), field("proj:code"))
+        shape = field("proj:shape")
+        bounds = _stac_bounds(field("proj:bbox"), field("proj:transform"), shape)
+
+        if crs is None or bounds is None or not shape or len(shape) != 2:
+            logger.debug(f"STAC item lacks projection fields for {url}")
+            return None
+
+        wgs84_bounds = transform_bounds(crs, "EPSG:4326", *bounds)
+    except Exception as e:
+        logger.warning(f"Could not use STAC projection fields for {url}: {e}")
+        return None
+
+    bands = field("raster:bands") or field("eo:bands") or []
+    dtype = bands[0].get("data_type") if bands and isinstance(bands[0], dict) else None
+
+    metadata = {
+        "extent": bounds,
+        "wgs84_extent": wgs84_bounds,
+        "crs_wkt": crs.to_wkt(),
+        "crs_proj4": crs.to_proj4(),
+        "crs_epsg": epsg if epsg is not None else crs.to_epsg(),
+        "width": shape[1],
+        "height": shape[0],
+        "count": len(bands) or None,
+        "dtype": dtype,
+    }
+
+    logger.info(f"Built COG metadata from STAC item for {url}")
+    return metadata
+
+
+def _stac_crs(epsg: Any, wkt2: Any, code: Any) -> Optional[CRS]:
+    if wkt2:
+        return CRS.from_wkt(wkt2)
+    if epsg is not None:
+        return CRS.from_epsg(epsg)
+    if code:
+        return CRS.from_string(code)
+    return None
+
+
+def _stac_bounds(bbox: Any, transform: Any, shape: Any) -> Optional[BoundingBox]:
+    if bbox and len(bbox) == 4:
+        return BoundingBox(*bbox)
+    if bbox and len(bbox) == 6:
+        return BoundingBox(bbox[0], bbox[1], bbox[3], bbox[4])
+
+    if transform and len(transform) >= 6 and shape and len(shape) == 2:
+        affine = Affine(*transform[:6])
+        height, width = shape
+        xs, ys = zip(affine @ (0, 0), affine @ (width, height))
+        return BoundingBox(min(xs), min(ys), max(xs), max(ys))
+
+    return None
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "8"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_stats = {"submitted": 0, "completed": 0, "pending": 0, "running": 0}
+_call_stats: Dict[str, Dict[str, Any]] = {}
+
+executor_queue_wait_seconds = histogram(
+    "executor_queue_wait_seconds",
+    "Time blocking calls wait for an executor worker",
+    ["call"],
+)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the shared executor for blocking work, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=BLOCKING_EXECUTOR_WORKERS,
+                thread_name_prefix="blocking",
+            )
+            logger.info(
+                f"Blocking executor started with {BLOCKING_EXECUTOR_WORKERS} workers"
+            )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """Shut down the shared executor, waiting for in-flight work to finish."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+        logger.info("Blocking executor shut down")
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking callable on the shared executor so it doesn't stall the event loop.
+
+    The queue depth seen by each call (the number of submitted calls still waiting
+    for a worker) is recorded per callable name. The call runs in a copy of the
+    caller's context, so the current trace span carries over to the worker.
+    """
+    name = getattr(func, "__name__", repr(func))
+    context = contextvars.copy_context()
+    submitted_at = time.monotonic()
+
+    with _lock:
+        queue_depth = _stats["pending"] - _stats["running"]
+        _stats["submitted"] += 1
+        _stats["pending"] += 1
+        call_stats = _call_stats.setdefault(
+            name,
+            {
+                "calls": 0,
+                "queue_depth_total": 0,
+                "queue_depth_max": 0,
+                "wait_total": 0.0,
+            },
+        )
+        call_stats["calls"] += 1
+        call_stats["queue_depth_total"] += queue_depth
+        call_stats["queue_depth_max"] = max(call_stats["queue_depth_max"], queue_depth)
+
+    if queue_depth:
+        logger.debug(f"{name} queued behind {queue_depth} blocking calls")
+
+    def call() -> Any:
+        wait = time.monotonic() - submitted_at
+        executor_queue_wait_seconds.observe(wait, call=name)
+        with _lock:
+            _stats["running"] += 1
+            call_stats["wait_total"] += wait
+        try:
+            return context.run(func, *args, **kwargs)
+        finally:
+            with _lock:
+                _stats["running"] -= 1
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_executor(), functools.partial(call))
+    finally:
+        with _lock:
+            _stats["pending"] -= 1
+            _stats["completed"] += 1
+
+
+def executor_stats() -> Dict[str, Any]:
+    """Snapshot of executor occupancy and per-callable queue depth."""
+    with _lock:
+        calls = {
+            name: {
+                "calls": stats["calls"],
+                "queue_depth_avg": round(
+                    stats["queue_depth_total"] / stats["calls"], 3
+                ),
+                "queue_depth_max": stats["queue_depth_max"],
+                "queue_wait_avg": round(stats["wait_total"] / stats["calls"], 4),
+            }
+            for name, stats in _call_stats.items()
+        }
+        return {
+            "workers": BLOCKING_EXECUTOR_WORKERS,
+            "queue_depth": _stats["pending"] - _stats["running"],
+            **_stats,
+            "calls": calls,
+        }
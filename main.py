@@ -1,26 +1,82 @@
 import os
-import time
+import json
+import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, Response
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, HttpUrl, validator
-from create_qlr.create_qlr import create_qlr
-from run_notebook.run_notebook import execute_notebook, get_view_notebook_url
+from create_qlr.create_qlr import (
+    build_qlr,
+    cached_qlr_etag,
+    create_qlr,
+    merge_qlrs,
+    cog_metadata_flights,
+)
+from create_qlr.metadata_cache import cog_metadata_cache, cog_negative_cache
+from create_qlr.metadata_store import cog_metadata_store
+from create_qlr.get_template import template_registry
+from run_notebook.run_notebook import (
+    NotebookNotFoundError,
+    execute_notebook,
+    find_existing_output,
+    get_view_notebook_url,
+    kernel_info,
+    notebook_config_stats,
+    notebook_output_stats,
+    notebook_profile,
+    output_retention,
+    plan_notebook_batch,
+    record_output_use,
+    reload_kernels,
+    start_config_refresher,
+    warm_kernel_pool,
+)
+from run_notebook.kernel_pool import kernel_pool_stats, shutdown_kernel_pools
+from run_notebook.parameterize import source_notebooks
+from run_notebook.jobs import JobManager, JobStatus, QueueFullError
+from executor import run_blocking, shutdown_executor, executor_stats
+from admission import AdmissionMiddleware, admission_stats
+from metrics import MetricsMiddleware, registry as metrics_registry
+from tracing import TracingMiddleware, configure_tracing, shutdown_tracing
+from request_logging import RequestLoggingMiddleware, configure_logging
 
 # Configure logging
-log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, log_level, logging.INFO),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop shared background resources"""
+    configure_tracing()
+    template_registry.load()
+    start_config_refresher()
+    reload_kernels()
+    threading.Thread(target=warm_kernel_pool, daemon=True).start()
+    output_retention.start()
+    yield
+    output_retention.stop()
+    notebook_jobs.shutdown()
+    shutdown_kernel_pools()
+    shutdown_executor()
+    shutdown_tracing()
+
+
 app = FastAPI(
     title="Jupyter Notebook API",
     description="API for executing notebooks and generating QLR files",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Environment-based CORS configuration
@@ -28,6 +84,25 @@ ALLOWED_ORIGINS = os.getenv(
     "ALLOWED_ORIGINS", "http://127.0.0.1:5173,http://localhost:5173"
 ).split(",")
 
+# Batch QLR limits
+QLR_BATCH_MAX_LAYERS = int(os.getenv("QLR_BATCH_MAX_LAYERS", "100"))
+QLR_BATCH_CONCURRENCY = int(os.getenv("QLR_BATCH_CONCURRENCY", "8"))
+
+# Notebook runs are executed as background jobs
+notebook_jobs = JobManager(execute_notebook)
+# Seconds clients are asked to wait when the notebook job queue is full
+NOTEBOOK_JOB_RETRY_AFTER = int(os.getenv("NOTEBOOK_JOB_RETRY_AFTER", "5"))
+# Seconds between keep-alive comments on idle job event streams
+JOB_EVENTS_HEARTBEAT = float(os.getenv("JOB_EVENTS_HEARTBEAT", "15"))
+
+# Cache-Control sent with QLR responses (clients revalidate with the ETag)
+QLR_CACHE_CONTROL = os.getenv("QLR_CACHE_CONTROL", "public, max-age=3600")
+
+# Innermost, so rejected requests are still logged, traced and measured
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -36,80 +111,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Log all incoming requests with timing information"""
-    # Check if request logging is enabled
-    if not os.getenv("LOG_REQUESTS", "true").lower() == "true":
-        return await call_next(request)
-
-    start_time = time.time()
-    client_ip = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "unknown")
-
-    # Log request details
-    logger.info(
-        f"Request started: {request.method} {request.url.path} "
-        f"from {client_ip} (User-Agent: {user_agent})"
-    )
-
-    # Log query parameters if present
-    if request.query_params:
-        logger.debug(f"Query params: {dict(request.query_params)}")
-
-    # Log request body for POST/PUT requests if enabled
-    if os.getenv("LOG_REQUEST_BODY", "false").lower() == "true" and request.method in [
-        "POST",
-        "PUT",
-        "PATCH",
-    ]:
-        try:
-            body = await request.body()
-            if body:
-                logger.debug(
-                    f"Request body: {body.decode('utf-8')[:500]}..."
-                )  # Limit to 500 chars
-        except Exception as e:
-            logger.warning(f"Could not read request body: {e}")
-
-    # Process the request
-    try:
-        response = await call_next(request)
-    except Exception as e:
-        # Log any unhandled exceptions
-        process_time = time.time() - start_time
-        logger.error(
-            f"Request failed: {request.method} {request.url.path} "
-            f"-> Exception: {str(e)} in {process_time:.3f}s"
-        )
-        raise
-
-    # Calculate processing time
-    process_time = time.time() - start_time
-
-    # Log response details
-    status_emoji = (
-        "✅"
-        if 200 <= response.status_code < 300
-        else "❌"
-        if response.status_code >= 400
-        else "⚠️"
-    )
-    logger.info(
-        f"Request completed: {request.method} {request.url.path} "
-        f"-> {response.status_code} {status_emoji} in {process_time:.3f}s"
-    )
-
-    # Add timing header to response
-    response.headers["X-Process-Time"] = str(round(process_time, 3))
-
-    return response
+app.add_middleware(RequestLoggingMiddleware)
 
 
 class QLRRequest(BaseModel):
     url: HttpUrl
     collection: str
+    stac_item: Optional[Dict[str, Any]] = None
 
     @validator("collection")
     def validate_collection(cls, v):
@@ -118,15 +126,71 @@ class QLRRequest(BaseModel):
         return v.strip()
 
 
+class NotebookBatchRequest(BaseModel):
+    # Each set is parsed like the query parameters of /run/notebook/{id}
+    parameters: List[Dict[str, str]] = []
+    # Cartesian product of values per inputSpec key, applied to every set
+    sweep: Dict[str, List[str]] = {}
+    reuse: bool = True
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "version": "0.1.0"}
 
 
-@app.get("/run/notebook/{notebook_id}")
+def collect_stats() -> Dict[str, Any]:
+    return {
+        "cog_metadata_cache": cog_metadata_cache.stats(),
+        "cog_negative_cache": cog_negative_cache.stats(),
+        "cog_metadata_flights": cog_metadata_flights.stats(),
+        "cog_metadata_store": cog_metadata_store.stats(),
+        "executor": executor_stats(),
+        "notebook_config": notebook_config_stats(),
+        "notebook_jobs": notebook_jobs.stats(),
+        "kernel_pools": kernel_pool_stats(),
+        "source_notebooks": source_notebooks.stats(),
+        "notebook_outputs": notebook_output_stats(),
+        "notebook_retention": output_retention.stats(),
+        "admission": admission_stats(),
+    }
+
+
+# The same snapshots are exported as counters and gauges on /metrics
+metrics_registry.register_stats(collect_stats)
+
+
+@app.get("/stats")
+async def get_stats():
+    """Cache statistics for the QLR and notebook hot paths"""
+    return collect_stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for the QLR and notebook hot paths"""
+    return Response(
+        content=metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/kernels")
+async def get_kernels():
+    """Kernel selection currently used for notebook runs"""
+    return kernel_info()
+
+
+@app.post("/kernels/reload")
+async def post_kernels_reload():
+    """Rediscover installed kernelspecs and reselect the default kernel"""
+    return await run_blocking(reload_kernels)
+
+
+@app.get("/run/notebook/{notebook_id}", status_code=status.HTTP_202_ACCEPTED)
 async def run_notebook(notebook_id: str, request: Request):
-    """Execute a notebook with the given ID and request parameters"""
+    """Queue a notebook run with the given ID and request parameters"""
     try:
         # Validate notebook ID
         if not notebook_id or not notebook_id.strip():
@@ -142,19 +206,196 @@ async def run_notebook(notebook_id: str, request: Request):
                 detail="Invalid notebook ID format",
             )
 
-        output_id = execute_notebook(notebook_id.strip(), request)
-        return RedirectResponse(url=f"/view-notebook/{notebook_id}/{output_id}")
+        notebook_id = notebook_id.strip()
+
+        # Validates the run; an identical earlier run can be viewed straight away
+        output_id = await run_blocking(
+            find_existing_output, notebook_id, request.query_params
+        )
+        if output_id is not None:
+            return RedirectResponse(
+                url=f"/view-notebook/{notebook_id}/{output_id}",
+                status_code=status.HTTP_303_SEE_OTHER,
+            )
+
+        job = notebook_jobs.submit(notebook_id, request.query_params)
+        status_url = f"/jobs/{job.id}"
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={**job.to_dict(), "status_url": status_url},
+            headers={"Location": status_url},
+        )
 
+    except HTTPException:
+        raise
+    except NotebookNotFoundError as e:
+        logger.error(f"Notebook run rejected: {e}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except ValueError as e:
-        logger.error(f"Notebook execution failed: {e}")
+        logger.error(f"Notebook run rejected: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(f"Notebook job rejected: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(NOTEBOOK_JOB_RETRY_AFTER)},
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error queueing notebook execution: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+@app.post("/run/notebook/{notebook_id}/batch", status_code=status.HTTP_202_ACCEPTED)
+async def run_notebook_batch(notebook_id: str, batch: NotebookBatchRequest):
+    """Queue a notebook run per parameter set and return the batch's job manifest"""
+    # Sanitize notebook ID (basic security check)
+    notebook_id = notebook_id.strip()
+    if not notebook_id or not notebook_id.replace("-", "").replace("_", "").isalnum():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid notebook ID format",
+        )
+
+    try:
+        plans = await run_blocking(
+            plan_notebook_batch,
+            notebook_id,
+            batch.parameters,
+            batch.sweep,
+            batch.reuse,
+        )
+        job_batch = notebook_jobs.submit_batch(
+            notebook_id, [plan["parameters"] for plan in plans]
+        )
+    except HTTPException:
+        raise
+    except NotebookNotFoundError as e:
+        logger.error(f"Notebook batch rejected: {e}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        logger.error(f"Notebook batch rejected: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(f"Notebook batch rejected: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(NOTEBOOK_JOB_RETRY_AFTER)},
+        )
     except Exception as e:
-        logger.error(f"Unexpected error during notebook execution: {e}")
+        logger.error(f"Unexpected error queueing notebook batch: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
         )
 
+    status_url = f"/batches/{job_batch.id}"
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            **job_batch.to_dict(),
+            "status_url": status_url,
+            "jobs": [
+                {
+                    "index": index,
+                    "parameters": job.query_params,
+                    "output_id": plan["output_id"],
+                    "reused": plan["reused"],
+                    "job_id": job.id,
+                    "status_url": f"/jobs/{job.id}",
+                    "events_url": f"/jobs/{job.id}/events",
+                }
+                for index, (job, plan) in enumerate(zip(job_batch.jobs, plans))
+            ],
+        },
+        headers={"Location": status_url},
+    )
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Report the status of every job in a notebook batch"""
+    job_batch = notebook_jobs.get_batch(batch_id)
+    if job_batch is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Batch '{batch_id}' not found",
+        )
+
+    jobs = []
+    for index, job in enumerate(job_batch.jobs):
+        entry = {"index": index, "parameters": job.query_params, **job.to_dict()}
+        if job.output_id is not None:
+            entry["view_url"] = f"/view-notebook/{job.notebook_id}/{job.output_id}"
+        jobs.append(entry)
+    return {**job_batch.to_dict(), "jobs": jobs}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, redirect: bool = True):
+    """Report a notebook job's status, redirecting to the notebook once it succeeds"""
+    job = notebook_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{job_id}' not found"
+        )
+
+    content = job.to_dict()
+    if job.output_id is not None:
+        # Failed runs can have an output too: the notebook up to the failing cell
+        view_url = f"/view-notebook/{job.notebook_id}/{job.output_id}"
+        if redirect and job.status == JobStatus.SUCCEEDED:
+            return RedirectResponse(url=view_url, status_code=status.HTTP_303_SEE_OTHER)
+        content["view_url"] = view_url
+
+    return content
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str, request: Request):
+    """Stream a notebook job's status and cell progress as Server-Sent Events"""
+    job = notebook_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{job_id}' not found"
+        )
+
+    async def stream():
+        async for event in job.events.subscribe(heartbeat=JOB_EVENTS_HEARTBEAT):
+            if await request.is_disconnected():
+                return
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/notebooks/{notebook_id}/profile")
+async def get_notebook_profile(notebook_id: str, last: Optional[int] = None):
+    """
+    Per-cell timing and resource percentiles across a notebook's executed runs.
+
+    Only runs executed on a kernel are profiled, so this stays empty unless
+    NOTEBOOK_EXECUTION_MODE=execute (prepared notebooks never run a cell).
+    """
+    if not notebook_id.replace("-", "").replace("_", "").isalnum():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid notebook ID format",
+        )
+
+    return await run_blocking(notebook_profile, notebook_id, last)
+
 
 @app.get("/view-notebook/{notebook_id}/{output_id}")
 async def view_notebook(notebook_id: str, output_id: str):
@@ -180,6 +421,9 @@ async def view_notebook(notebook_id: str, output_id: str):
                 detail="Invalid output ID format",
             )
 
+        # Views keep an output from being garbage collected
+        await run_blocking(record_output_use, notebook_id, output_id)
+
         view_url = get_view_notebook_url(notebook_id, output_id)
         return RedirectResponse(url=view_url)
 
@@ -191,17 +435,57 @@ async def view_notebook(notebook_id: str, output_id: str):
         )
 
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (
+        tag[2:] if tag.startswith("W/") else tag for tag in candidates
+    )
+
+
 @app.get("/qlr")
-async def get_qlr(url: str, collection: str):
+async def get_qlr(
+    request: Request, url: str, collection: str, stac_item: Optional[str] = None
+):
+    if_none_match = request.headers.get("if-none-match")
     try:
-        qlr_xml = create_qlr(str(url), collection)
+        # Only inline STAC JSON is accepted over HTTP, never a server-side path
+        item = None
+        if stac_item:
+            try:
+                item = json.loads(stac_item)
+            except ValueError as e:
+                raise ValueError(f"Invalid STAC item: {e}")
+            if not isinstance(item, dict):
+                raise ValueError("Invalid STAC item: expected a JSON object")
+
+        # Revalidation of a QLR whose metadata is cached needs no COG read at all
+        if if_none_match and item is None:
+            etag = cached_qlr_etag(url, collection)
+            if etag and etag_matches(if_none_match, etag):
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": QLR_CACHE_CONTROL},
+                )
+
+        qlr_xml, etag = await run_blocking(build_qlr, str(url), collection, None, item)
+        if etag_matches(if_none_match, etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": etag, "Cache-Control": QLR_CACHE_CONTROL},
+            )
+
         logger.info(f"QLR created successfully for {url} with collection {collection}")
         output_filename = Path(url).name + ".qlr"
         return Response(
             content=qlr_xml,
             media_type="application/xml",
             headers={
-                "Content-Disposition": f'attachment; filename="{output_filename}"'
+                "Content-Disposition": f'attachment; filename="{output_filename}"',
+                "ETag": etag,
+                "Cache-Control": QLR_CACHE_CONTROL,
             },
         )
     except ValueError as e:
@@ -213,3 +497,59 @@ async def get_qlr(url: str, collection: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
         )
+
+
+@app.post("/qlr/batch")
+async def get_qlr_batch(layers: List[QLRRequest]):
+    """Generate a single multi-layer QLR from many COG URLs"""
+    if not layers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one layer is required",
+        )
+
+    if len(layers) > QLR_BATCH_MAX_LAYERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can contain at most {QLR_BATCH_MAX_LAYERS} layers",
+        )
+
+    # Layer IDs must be unique within the QLR, so suffix repeated file names
+    layer_ids = []
+    seen = {}
+    for layer in layers:
+        name = Path(str(layer.url)).name
+        seen[name] = seen.get(name, 0) + 1
+        layer_ids.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+
+    semaphore = asyncio.Semaphore(QLR_BATCH_CONCURRENCY)
+
+    async def create_layer(layer: QLRRequest, layer_id: str) -> str:
+        async with semaphore:
+            return await run_blocking(
+                create_qlr, str(layer.url), layer.collection, layer_id, layer.stac_item
+            )
+
+    try:
+        qlr_docs = await asyncio.gather(
+            *(
+                create_layer(layer, layer_id)
+                for layer, layer_id in zip(layers, layer_ids)
+            )
+        )
+        qlr_xml = merge_qlrs(qlr_docs)
+        logger.info(f"Batch QLR created successfully with {len(layers)} layers")
+        return Response(
+            content=qlr_xml,
+            media_type="application/xml",
+            headers={"Content-Disposition": 'attachment; filename="layers.qlr"'},
+        )
+    except ValueError as e:
+        logger.error(f"Batch QLR generation failed: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error during batch QLR generation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
@@ -0,0 +1,390 @@
+"""
+Prometheus metrics in the text exposition format.
+
+prometheus_client isn't a dependency, so this implements the small part of it
+the service needs: counters, gauges and histograms with labels, plus
+collectors that turn the existing stats() snapshots into counters and gauges
+at scrape time.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE = "eodh"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# stats() fields that only ever go up, exported as counters; all other numeric
+# fields are gauges
+COUNTER_FIELDS = frozenset(
+    {
+        "admitted",
+        "bytes_reclaimed",
+        "coalesced",
+        "completed",
+        "created",
+        "errors",
+        "evictions",
+        "executions",
+        "expirations",
+        "failed",
+        "failures",
+        "files_deleted",
+        "hits",
+        "loads",
+        "misses",
+        "not_modified",
+        "reaped",
+        "refreshes",
+        "rejected",
+        "retired",
+        "reused",
+        "revalidated",
+        "runs",
+        "scans",
+        "started",
+        "stores",
+        "submitted",
+        "succeeded",
+        "total_run_seconds",
+        "writes",
+    }
+)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = f"{METRICS_NAMESPACE}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    @property
+    def family_name(self) -> str:
+        """The name used on the HELP and TYPE lines."""
+        return self.name
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    @property
+    def family_name(self) -> str:
+        # Counter samples carry the _total suffix, so the family does too
+        return f"{self.name}_total"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                (self.family_name, dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                (self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: (count per bucket plus +Inf, sum)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        {**labels, "le": _format_value(bound)},
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_count", labels, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+        return samples
+
+
+class Registry:
+    """The metrics and scrape-time collectors exposed on /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, collector: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Export a stats() style snapshot at scrape time: every numeric field of
+        each top-level component becomes a metric named after the component and
+        field, e.g. {"executor": {"queue_depth": 3}} -> eodh_executor_queue_depth.
+        Fields in COUNTER_FIELDS become counters, e.g. eodh_executor_submitted_total.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            samples = metric.samples()
+            lines.append(f"# HELP {metric.family_name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.family_name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in collectors:
+            try:
+                snapshot = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for component, stats in snapshot.items():
+                lines.extend(_stats_lines(component, stats))
+
+        return "\n".join(lines) + "\n"
+
+
+def _stats_lines(component: str, stats: Any) -> List[str]:
+    # Lists of stats (e.g. one per kernel pool) are labelled by their first
+    # string field; nested dicts are left to the JSON /stats endpoint
+    if isinstance(stats, list):
+        entries = []
+        for item in stats:
+            if not isinstance(item, dict):
+                continue
+            label = next(
+                (
+                    (name, value)
+                    for name, value in item.items()
+                    if isinstance(value, str)
+                ),
+                None,
+            )
+            entries.append(({label[0]: label[1]} if label else {}, item))
+    elif isinstance(stats, dict):
+        entries = [({}, stats)]
+    else:
+        return []
+
+    metrics: Dict[Tuple[str, str, str], List[str]] = {}
+    for labels, item in entries:
+        for field, value in item.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{METRICS_NAMESPACE}_{component}_{field}"
+            if field in COUNTER_FIELDS:
+                metric_type, name = "counter", f"{name}_total"
+            else:
+                metric_type = "gauge"
+            metrics.setdefault((name, metric_type, field), []).append(
+                f"{name}{_format_labels(labels)} {_format_value(value)}"
+            )
+
+    lines = []
+    for (name, metric_type, field), samples in metrics.items():
+        lines.append(f"# HELP {name} {field} from the {component} stats")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+    return lines
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# HTTP metrics, recorded by MetricsMiddleware
+http_request_duration = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+http_requests_in_flight = gauge(
+    "http_requests_in_flight", "HTTP requests being handled", ["method"]
+)
+
+
+def route_label(scope: Dict[str, Any]) -> str:
+    """The matched route's path template, so path parameters don't become labels."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", "unknown")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_requests_in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method=method)
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=method,
+                route=route_label(scope),
+                status=status_code or 500,
+            )
@@ -0,0 +1,229 @@
+"""
+Application logging setup and per-request access logs.
+
+Log records are handed to a queue on the calling thread and written by a
+QueueListener thread, so slow stderr or file I/O never blocks a request. The
+request middleware reads its settings once at import and only formats what
+will actually be logged.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "true").lower() == "true"
+# Logged at DEBUG, truncated to LOG_REQUEST_BODY_MAX bytes
+LOG_REQUEST_BODY = os.getenv("LOG_REQUEST_BODY", "false").lower() == "true"
+LOG_REQUEST_BODY_MAX = int(os.getenv("LOG_REQUEST_BODY_MAX", "500"))
+# Fraction of successful requests logged; errors and slow requests always are
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1"))
+LOG_SLOW_REQUEST_SECONDS = float(os.getenv("LOG_SLOW_REQUEST_SECONDS", "1"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else was passed in extra=
+_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed in extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(
+    level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, stream: Any = None
+) -> None:
+    """
+    Send all logging through a queue to a stream handler on a listener thread.
+    Safe to call again, e.g. to switch format in a benchmark.
+    """
+    global _listener
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(stop_logging)
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class RequestLoggingMiddleware:
+    """
+    ASGI middleware logging each request's outcome and timing, and adding an
+    X-Process-Time header with the seconds taken until the response started.
+
+    Successful requests are sampled at LOG_SUCCESS_SAMPLE_RATE unless they took
+    longer than LOG_SLOW_REQUEST_SECONDS. Request bodies are captured as the
+    application reads them, never read ahead of it.
+    """
+
+    def __init__(
+        self,
+        app,
+        enabled: bool = LOG_REQUESTS,
+        sample_rate: float = LOG_SUCCESS_SAMPLE_RATE,
+        slow_seconds: float = LOG_SLOW_REQUEST_SECONDS,
+        log_body: bool = LOG_REQUEST_BODY,
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.log_body = log_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        status_code: Optional[int] = None
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                f"Request started: {method} {path} from {self._client(scope)} "
+                f"(User-Agent: {_header(scope, b'user-agent') or 'unknown'})"
+            )
+        if scope.get("query_string") and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Query string: {scope['query_string'].decode('latin-1')}")
+
+        body = None
+        if (
+            self.log_body
+            and method in BODY_METHODS
+            and logger.isEnabledFor(logging.DEBUG)
+        ):
+            body = bytearray()
+            app_receive = receive
+
+            async def receive(body=body):
+                message = await app_receive()
+                if (
+                    message["type"] == "http.request"
+                    and len(body) < LOG_REQUEST_BODY_MAX
+                ):
+                    body.extend(
+                        message.get("body", b"")[: LOG_REQUEST_BODY_MAX - len(body)]
+                    )
+                return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = str(round(time.perf_counter() - start, 3))
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"x-process-time", process_time.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            logger.error(
+                f"Request failed: {method} {path} -> Exception: {e} "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+            raise
+        finally:
+            if body:
+                logger.debug(f"Request body: {body.decode('utf-8', 'replace')}")
+
+        process_time = time.perf_counter() - start
+        status_code = status_code or 500
+        if (
+            status_code < 400
+            and process_time < self.slow_seconds
+            and self.sample_rate < 1
+            and random.random() >= self.sample_rate
+        ):
+            return
+
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        status_emoji = (
+            "✅" if 200 <= status_code < 300 else "❌" if status_code >= 400 else "⚠️"
+        )
+        logger.info(
+            f"Request completed: {method} {path} -> {status_code} {status_emoji} "
+            f"in {process_time:.3f}s",
+            extra={
+                "method": method,
+                "path": path,
+                "status": status_code,
+                "duration": round(process_time, 6),
+                "client": self._client(scope),
+            },
+        )
+
+    @staticmethod
+    def _client(scope: Dict[str, Any]) -> str:
+        client = scope.get("client")
+        return client[0] if client else "unknown"
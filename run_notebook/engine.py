@@ -0,0 +1,130 @@
+import logging
+import time
+
+from papermill.clientwrap import PapermillNotebookClient
+from papermill.engines import NBClientEngine, papermill_engines
+from papermill.log import logger as papermill_logger
+from papermill.utils import merge_kwargs, remove_args
+
+from run_notebook.profiling import NOTEBOOK_PROFILE_CELLS, CellProfiler, kernel_pid
+
+logger = logging.getLogger(__name__)
+
+POOLED_ENGINE_NAME = "eodh-pooled"
+
+
+class PooledKernelEngine(NBClientEngine):
+    """
+    nbclient engine for running notebooks on an already started kernel.
+
+    The caller passes the kernel manager as ``km``; the engine leaves the kernel
+    running afterwards but closes the client channels it opened, so a pooled
+    kernel can be reused without leaking sockets. An optional
+    ``progress_callback`` receives an event as each cell starts and finishes.
+
+    Each code cell's wall time and the kernel process's CPU time, peak RSS
+    growth and bytes read are recorded in the cell's "profile" metadata.
+    """
+
+    @classmethod
+    def execute_managed_notebook(
+        cls,
+        nb_man,
+        kernel_name,
+        log_output=False,
+        stdout_file=None,
+        stderr_file=None,
+        start_timeout=60,
+        execution_timeout=None,
+        **kwargs,
+    ):
+        progress_callback = kwargs.pop("progress_callback", None)
+        profiler = None
+        if NOTEBOOK_PROFILE_CELLS:
+            profiler = CellProfiler(kernel_pid(kwargs.get("km")))
+        instrument_cells(nb_man, progress_callback, profiler)
+
+        # Same argument handling as papermill's NBClientEngine
+        kwargs = remove_args(["input_path"], **kwargs)
+        safe_kwargs = remove_args(["timeout", "startup_timeout"], **kwargs)
+        final_kwargs = merge_kwargs(
+            safe_kwargs,
+            timeout=execution_timeout if execution_timeout else kwargs.get("timeout"),
+            startup_timeout=start_timeout,
+            kernel_name=kernel_name,
+            log=papermill_logger,
+            log_output=log_output,
+            stdout_file=stdout_file,
+            stderr_file=stderr_file,
+        )
+
+        client = PapermillNotebookClient(nb_man, **final_kwargs)
+        try:
+            return client.execute()
+        finally:
+            if client.kc is not None:
+                client.kc.stop_channels()
+
+
+def instrument_cells(nb_man, progress_callback=None, profiler=None) -> None:
+    """
+    Wrap a notebook execution manager's cell hooks to publish progress events
+    and record cell profiles.
+    """
+    if progress_callback is None and profiler is None:
+        return
+
+    cell_start = nb_man.cell_start
+    cell_exception = nb_man.cell_exception
+    cell_complete = nb_man.cell_complete
+    cell_count = len(nb_man.nb.cells)
+    started = {}
+    failed = set()
+
+    def on_cell_start(cell, cell_index=None, **kwargs):
+        started[cell_index] = time.monotonic()
+        if progress_callback is not None:
+            progress_callback(
+                {
+                    "event": "cell_start",
+                    "cell_index": cell_index,
+                    "cell_count": cell_count,
+                    "cell_type": cell.cell_type,
+                }
+            )
+        result = cell_start(cell, cell_index, **kwargs)
+        if profiler is not None and cell.cell_type == "code":
+            profiler.start(cell_index)
+        return result
+
+    def on_cell_exception(cell, cell_index=None, **kwargs):
+        failed.add(cell_index)
+        return cell_exception(cell, cell_index, **kwargs)
+
+    def on_cell_complete(cell, cell_index=None, **kwargs):
+        # Recorded before papermill saves the cell
+        profile = profiler.finish(cell_index) if profiler is not None else None
+        if profile is not None:
+            cell.metadata["profile"] = profile
+
+        result = cell_complete(cell, cell_index, **kwargs)
+        start = started.pop(cell_index, None)
+        if progress_callback is not None:
+            progress_callback(
+                {
+                    "event": "cell_finish",
+                    "cell_index": cell_index,
+                    "cell_count": cell_count,
+                    "status": "failed" if cell_index in failed else "completed",
+                    "duration": round(time.monotonic() - start, 3) if start else None,
+                    "profile": profile,
+                }
+            )
+        return result
+
+    nb_man.cell_start = on_cell_start
+    nb_man.cell_exception = on_cell_exception
+    nb_man.cell_complete = on_cell_complete
+
+
+papermill_engines.register(POOLED_ENGINE_NAME, PooledKernelEngine)
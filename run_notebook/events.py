@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a job's event stream
+_CLOSED = object()
+
+
+class JobEvents:
+    """
+    Fan-out of one job's progress events to any number of async subscribers.
+
+    The job's worker thread publishes each event once; it is kept in the
+    history, so late subscribers replay what they missed, and handed to every
+    subscriber's queue on that subscriber's event loop.
+    """
+
+    def __init__(self):
+        self._history: List[Dict[str, Any]] = []
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Record an event and push it to every subscriber. Thread-safe."""
+        event = {**event, "time": time.time()}
+        with self._lock:
+            if self._closed:
+                return
+            self._history.append(event)
+            self._push(event)
+
+    def close(self) -> None:
+        """End the stream; subscribers finish after the events already sent."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._push(_CLOSED)
+
+    async def subscribe(
+        self, heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's events from the beginning until the job finishes.
+
+        With a heartbeat, None is yielded after that many idle seconds so the
+        caller can keep the connection alive.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            # Snapshot and register together so no event is missed or repeated
+            history = list(self._history)
+            closed = self._closed
+            if not closed:
+                self._subscribers.append(subscriber)
+
+        try:
+            for event in history:
+                yield event
+            if closed:
+                return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is _CLOSED:
+                    return
+                yield event
+        finally:
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+
+    def _push(self, event: Any) -> None:
+        # Called with the lock held
+        for loop, queue in list(self._subscribers):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's event loop has closed
+                self._subscribers.remove((loop, queue))
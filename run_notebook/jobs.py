@@ -0,0 +1,318 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional
+
+from fastapi import HTTPException
+
+from run_notebook.events import JobEvents
+from run_notebook.run_notebook import NotebookExecutionError
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOK_JOB_WORKERS = int(os.getenv("NOTEBOOK_JOB_WORKERS", "4"))
+NOTEBOOK_JOB_MAX_QUEUE = int(os.getenv("NOTEBOOK_JOB_MAX_QUEUE", "100"))
+NOTEBOOK_JOB_PER_NOTEBOOK_LIMIT = int(os.getenv("NOTEBOOK_JOB_PER_NOTEBOOK_LIMIT", "2"))
+# Seconds to keep finished jobs around for status lookups
+NOTEBOOK_JOB_RETENTION = float(os.getenv("NOTEBOOK_JOB_RETENTION", "3600"))
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+@dataclass
+class Job:
+    id: str
+    notebook_id: str
+    query_params: Dict[str, str]
+    status: JobStatus = JobStatus.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    output_id: Optional[str] = None
+    error: Optional[str] = None
+    events: JobEvents = field(default_factory=JobEvents, repr=False, compare=False)
+    # The submitting request's context, so the run's spans join its trace
+    context: contextvars.Context = field(
+        default_factory=contextvars.copy_context, repr=False, compare=False
+    )
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        queued_until = self.started_at or self.finished_at or now
+        return {
+            "job_id": self.id,
+            "notebook_id": self.notebook_id,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round(queued_until - self.created_at, 3),
+            "run_seconds": (
+                round((self.finished_at or now) - self.started_at, 3)
+                if self.started_at
+                else None
+            ),
+            "output_id": self.output_id,
+            "error": self.error,
+        }
+
+
+@dataclass
+class Batch:
+    """Jobs submitted together for one notebook, reported as a whole."""
+
+    id: str
+    notebook_id: str
+    jobs: List[Job]
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return all(job.finished for job in self.jobs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self.jobs:
+            counts[job.status.value] += 1
+        return {
+            "batch_id": self.id,
+            "notebook_id": self.notebook_id,
+            "created_at": self.created_at,
+            "runs": len(self.jobs),
+            "finished": self.finished,
+            **counts,
+        }
+
+
+class JobManager:
+    """
+    Runs notebook jobs on a bounded worker pool.
+
+    The run callable is called as run(notebook_id, query_params, progress=...),
+    where progress publishes an event to the job's event stream.
+
+    Jobs wait in a FIFO queue of at most max_queue entries. A queued job is only
+    dispatched while fewer than per_notebook_limit jobs for the same notebook
+    are running, so one busy notebook can't take every worker.
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., str],
+        workers: int = NOTEBOOK_JOB_WORKERS,
+        max_queue: int = NOTEBOOK_JOB_MAX_QUEUE,
+        per_notebook_limit: int = NOTEBOOK_JOB_PER_NOTEBOOK_LIMIT,
+        retention: float = NOTEBOOK_JOB_RETENTION,
+    ):
+        self._run_notebook = run
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_notebook_limit = per_notebook_limit
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._batches: Dict[str, Batch] = {}
+        self._pending: Deque[Job] = deque()
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, notebook_id: str, query_params: Mapping[str, str]) -> Job:
+        """Queue a notebook run. Raises QueueFullError when the queue is full."""
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Notebook job queue is full ({self.max_queue} jobs waiting)"
+                )
+
+            job = Job(str(uuid.uuid4()), notebook_id, dict(query_params))
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self.submitted += 1
+            self._publish_status(job)
+            self._prune()
+            self._dispatch()
+
+        logger.info(f"Queued job {job.id} for notebook {notebook_id}")
+        return job
+
+    def submit_batch(self, notebook_id: str, runs: List[Mapping[str, str]]) -> Batch:
+        """
+        Queue one job per run. The batch is queued whole or not at all; raises
+        QueueFullError when the queue can't take every run.
+        """
+        with self._lock:
+            if len(self._pending) + len(runs) > self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Notebook job queue can't take {len(runs)} more jobs "
+                    f"({len(self._pending)} of {self.max_queue} waiting)"
+                )
+
+            jobs = [Job(str(uuid.uuid4()), notebook_id, dict(run)) for run in runs]
+            batch = Batch(str(uuid.uuid4()), notebook_id, jobs)
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._pending.append(job)
+                self._publish_status(job)
+            self._batches[batch.id] = batch
+            self.submitted += len(jobs)
+            self._prune()
+            self._dispatch()
+
+        logger.info(
+            f"Queued batch {batch.id} of {len(jobs)} jobs for notebook {notebook_id}"
+        )
+        return batch
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_batch(self, batch_id: str) -> Optional[Batch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "per_notebook_limit": self.per_notebook_limit,
+                "queue_depth": len(self._pending),
+                "running": self._running_total,
+                "running_by_notebook": dict(self._running),
+                "submitted": self.submitted,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _dispatch(self) -> None:
+        # Called with the lock held
+        while self._running_total < self.workers and self._pending:
+            job = next(
+                (
+                    queued
+                    for queued in self._pending
+                    if self._running.get(queued.notebook_id, 0)
+                    < self.per_notebook_limit
+                ),
+                None,
+            )
+            if job is None:
+                return
+
+            self._pending.remove(job)
+            self._running[job.notebook_id] = self._running.get(job.notebook_id, 0) + 1
+            self._running_total += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="notebook-job"
+                )
+            self._executor.submit(job.context.run, self._run, job)
+
+    def _run(self, job: Job) -> None:
+        job.started_at = time.time()
+        job.status = JobStatus.RUNNING
+        self._publish_status(job)
+        logger.info(f"Running job {job.id} for notebook {job.notebook_id}")
+
+        try:
+            with span(
+                "notebook_job",
+                **{
+                    "job.id": job.id,
+                    "job.queue_seconds": job.started_at - job.created_at,
+                },
+            ):
+                job.output_id = self._run_notebook(
+                    job.notebook_id, job.query_params, progress=job.events.publish
+                )
+            job.status = JobStatus.SUCCEEDED
+        except NotebookExecutionError as e:
+            # The failed notebook is kept, so point the client at it
+            job.output_id = e.output_id
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        except ValueError as e:
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        except HTTPException as e:
+            job.error = str(e.detail)
+            job.status = JobStatus.FAILED
+        except Exception as e:
+            logger.error(f"Unexpected error in job {job.id}: {e}")
+            job.error = "Internal server error"
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+            logger.info(
+                f"Job {job.id} {job.status.value} in "
+                f"{job.finished_at - job.started_at:.3f}s"
+            )
+            self._publish_status(job)
+            job.events.close()
+            with self._lock:
+                if job.status == JobStatus.SUCCEEDED:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+                self._running[job.notebook_id] -= 1
+                if not self._running[job.notebook_id]:
+                    del self._running[job.notebook_id]
+                self._running_total -= 1
+                self._dispatch()
+
+    def _publish_status(self, job: Job) -> None:
+        job.events.publish({"event": "status", **job.to_dict()})
+
+    def _prune(self) -> None:
+        # Called with the lock held; drop finished jobs past their retention
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        expired_batches = [
+            batch_id
+            for batch_id, batch in self._batches.items()
+            if batch.finished and max(job.finished_at for job in batch.jobs) < cutoff
+        ]
+        for batch_id in expired_batches:
+            del self._batches[batch_id]
@@ -0,0 +1,318 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from jupyter_client import AsyncKernelManager, BlockingKernelClient
+from jupyter_core.utils import run_sync
+
+logger = logging.getLogger(__name__)
+
+KERNEL_POOL_SIZE = int(os.getenv("KERNEL_POOL_SIZE", "2"))
+# Kernels are replaced after this many notebook runs
+KERNEL_POOL_MAX_REUSE = int(os.getenv("KERNEL_POOL_MAX_REUSE", "20"))
+# Idle kernels are shut down after this many seconds
+KERNEL_POOL_IDLE_TIMEOUT = float(os.getenv("KERNEL_POOL_IDLE_TIMEOUT", "600"))
+KERNEL_POOL_ACQUIRE_TIMEOUT = float(os.getenv("KERNEL_POOL_ACQUIRE_TIMEOUT", "300"))
+KERNEL_POOL_START_TIMEOUT = float(os.getenv("KERNEL_POOL_START_TIMEOUT", "60"))
+# Modules imported into every kernel when it starts, so runs don't pay for them
+KERNEL_POOL_PREIMPORT = [
+    module.strip()
+    for module in os.getenv(
+        "KERNEL_POOL_PREIMPORT", "numpy,rioxarray,matplotlib.pyplot"
+    ).split(",")
+    if module.strip()
+]
+
+# Records the state a fresh kernel starts with, for RESET_CODE to restore
+BASELINE_CODE = """
+import os as _os, sys as _sys
+get_ipython()._pool_baseline = (_os.getcwd(), dict(_os.environ), list(_sys.path))
+if "matplotlib" in _sys.modules:
+    get_ipython()._pool_baseline += (dict(_sys.modules["matplotlib"].rcParams),)
+del _os, _sys
+"""
+
+# Restores the working directory, environment, sys.path and matplotlib settings
+# and figures, then clears the user namespace. Imported modules stay loaded with
+# whatever state a run left in them; set KERNEL_POOL_MAX_REUSE=1 for notebooks
+# that depend on pristine module state.
+RESET_CODE = """
+import os as _os, sys as _sys
+_cwd, _env, _path, *_rc = get_ipython()._pool_baseline
+_os.chdir(_cwd)
+_os.environ.clear()
+_os.environ.update(_env)
+_sys.path[:] = _path
+if "matplotlib.pyplot" in _sys.modules:
+    _sys.modules["matplotlib.pyplot"].close("all")
+if _rc:
+    _sys.modules["matplotlib"].rcParams.update(_rc[0])
+get_ipython().run_line_magic("reset", "-f")
+get_ipython().execution_count = 1
+"""
+
+
+def preimport_code(modules: List[str]) -> str:
+    lines = []
+    for module in modules:
+        lines.append("try:")
+        lines.append(f"    import {module}")
+        lines.append("except ImportError:")
+        lines.append("    pass")
+    return "\n".join(lines)
+
+
+class PooledKernel:
+    """A started kernel with its reuse bookkeeping."""
+
+    def __init__(self, kernel_name: str):
+        self.km = AsyncKernelManager(kernel_name=kernel_name)
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    def start(self, code: str, timeout: float) -> None:
+        run_sync(self.km.start_kernel)()
+        if not self.execute(code, timeout):
+            raise RuntimeError("Kernel warm-up code failed")
+
+    def execute(self, code: str, timeout: float) -> bool:
+        """Run code in the kernel on a short-lived client; True if it succeeded."""
+        kc = BlockingKernelClient()
+        kc.load_connection_info(self.km.get_connection_info())
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=timeout)
+            reply = kc.execute_interactive(
+                code, timeout=timeout, store_history=False, output_hook=lambda msg: None
+            )
+            return reply["content"]["status"] == "ok"
+        except Exception as e:
+            logger.warning(f"Kernel {self.km.kernel_id} failed to run code: {e}")
+            return False
+        finally:
+            kc.stop_channels()
+
+    def is_alive(self) -> bool:
+        try:
+            return run_sync(self.km.is_alive)()
+        except Exception:
+            return False
+
+    def shutdown(self) -> None:
+        try:
+            run_sync(self.km.shutdown_kernel)(now=True)
+        except Exception as e:
+            logger.warning(f"Failed to shut down kernel {self.km.kernel_id}: {e}")
+
+
+class KernelPool:
+    """
+    A bounded pool of pre-started kernels for one kernel spec.
+
+    Kernels are started with the configured modules already imported. After
+    each run a kernel's namespace is reset and it goes back to the pool, until
+    it has served max_reuse runs or a run fails, when it is replaced. Kernels
+    idle for longer than idle_timeout are shut down by a reaper thread.
+    """
+
+    def __init__(
+        self,
+        kernel_name: str,
+        size: int = KERNEL_POOL_SIZE,
+        max_reuse: int = KERNEL_POOL_MAX_REUSE,
+        idle_timeout: float = KERNEL_POOL_IDLE_TIMEOUT,
+        preimport: Optional[List[str]] = None,
+    ):
+        self.kernel_name = kernel_name
+        self.size = size
+        self.max_reuse = max_reuse
+        self.idle_timeout = idle_timeout
+        self._preimport_code = preimport_code(
+            KERNEL_POOL_PREIMPORT if preimport is None else preimport
+        )
+        self._idle: List[PooledKernel] = []
+        self._total = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.started = 0
+        self.reused = 0
+        self.retired = 0
+        self.reaped = 0
+        self._reaper = threading.Thread(
+            target=self._reap, name=f"kernel-reaper-{kernel_name}", daemon=True
+        )
+        self._reaper.start()
+
+    def fill(self) -> None:
+        """Start kernels until the pool is at its configured size."""
+        while True:
+            with self._condition:
+                if self._closed or self._total >= self.size:
+                    return
+                self._total += 1
+            try:
+                kernel = self._start_kernel()
+            except Exception as e:
+                with self._condition:
+                    self._total -= 1
+                    self._condition.notify()
+                logger.error(f"Failed to pre-start {self.kernel_name} kernel: {e}")
+                return
+            self._release(kernel)
+
+    @contextmanager
+    def kernel(
+        self, timeout: float = KERNEL_POOL_ACQUIRE_TIMEOUT
+    ) -> Iterator[AsyncKernelManager]:
+        """Borrow a warm kernel manager for one notebook run."""
+        kernel = self._acquire(timeout)
+        healthy = False
+        try:
+            yield kernel.km
+            healthy = True
+        finally:
+            kernel.uses += 1
+            kernel.last_used = time.monotonic()
+            if healthy and kernel.uses < self.max_reuse and self._reset(kernel):
+                self.reused += 1
+                self._release(kernel)
+            else:
+                self._retire(kernel)
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._condition.notify_all()
+        for kernel in idle:
+            kernel.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "kernel_name": self.kernel_name,
+                "size": self.size,
+                "kernels": self._total,
+                "idle": len(self._idle),
+                "busy": self._total - len(self._idle),
+                "started": self.started,
+                "reused": self.reused,
+                "retired": self.retired,
+                "reaped": self.reaped,
+            }
+
+    def _acquire(self, timeout: float) -> PooledKernel:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Kernel pool is shut down")
+                if self._idle:
+                    return self._idle.pop()
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Timed out waiting for a {self.kernel_name} kernel"
+                    )
+                self._condition.wait(remaining)
+
+        # Pool wasn't full: start a kernel for this caller outside the lock
+        try:
+            return self._start_kernel()
+        except Exception:
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+            raise
+
+    def _start_kernel(self) -> PooledKernel:
+        start = time.monotonic()
+        kernel = PooledKernel(self.kernel_name)
+        try:
+            kernel.start(
+                self._preimport_code + BASELINE_CODE, KERNEL_POOL_START_TIMEOUT
+            )
+        except Exception:
+            kernel.shutdown()
+            raise
+        self.started += 1
+        elapsed = time.monotonic() - start
+        logger.info(f"Started pooled {self.kernel_name} kernel in {elapsed:.2f}s")
+        return kernel
+
+    def _reset(self, kernel: PooledKernel) -> bool:
+        return kernel.is_alive() and kernel.execute(
+            RESET_CODE, KERNEL_POOL_START_TIMEOUT
+        )
+
+    def _release(self, kernel: PooledKernel) -> None:
+        with self._condition:
+            if not self._closed:
+                self._idle.append(kernel)
+                self._condition.notify()
+                return
+            self._total -= 1
+        kernel.shutdown()
+
+    def _retire(self, kernel: PooledKernel) -> None:
+        kernel.shutdown()
+        with self._condition:
+            self._total -= 1
+            self.retired += 1
+            self._condition.notify()
+        logger.info(
+            f"Retired pooled {self.kernel_name} kernel after {kernel.uses} runs"
+        )
+
+        # Keep the pool warm for the next run
+        threading.Thread(target=self.fill, daemon=True).start()
+
+    def _reap(self) -> None:
+        interval = max(1.0, self.idle_timeout / 4)
+        while True:
+            time.sleep(interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            with self._condition:
+                if self._closed:
+                    return
+                stale = [kernel for kernel in self._idle if kernel.last_used < cutoff]
+                self._idle = [kernel for kernel in self._idle if kernel not in stale]
+                self._total -= len(stale)
+                self.reaped += len(stale)
+            for kernel in stale:
+                logger.info(f"Reaping idle {self.kernel_name} kernel")
+                kernel.shutdown()
+
+
+_pools: Dict[str, KernelPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_kernel_pool(kernel_name: str) -> KernelPool:
+    """Get the kernel pool for a kernel spec, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(kernel_name)
+        if pool is None:
+            pool = _pools[kernel_name] = KernelPool(kernel_name)
+        return pool
+
+
+def kernel_pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def shutdown_kernel_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,111 @@
+"""
+Move existing output notebooks into the configured output layout.
+
+    python -m run_notebook.migrate_layout [--layout sharded] [--dry-run]
+
+Outputs are recognised by their "{notebook_id}-{output_id}.ipynb" file name
+wherever they are under the notebooks directory, so the tool also migrates
+back from sharded to flat. Run it with the API stopped, or expect outputs
+written during the migration to need a second pass.
+"""
+
+import argparse
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from run_notebook.profiling import profile_path
+from run_notebook.run_notebook import (
+    NOTEBOOK_OUTPUT_LAYOUT,
+    NOTEBOOKS_DIR,
+    OUTPUT_ID_PATTERN,
+    OUTPUT_LAYOUTS,
+    get_output_relpath,
+)
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_NAME_RE = re.compile(
+    rf"^(?P<notebook_id>.+)-(?P<output_id>{OUTPUT_ID_PATTERN})\.ipynb$"
+)
+
+
+def find_outputs(root: Path) -> Iterator[Tuple[Path, str, str]]:
+    """Yield (path, notebook_id, output_id) for every output under root."""
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            match = OUTPUT_NAME_RE.match(filename)
+            if match:
+                yield (
+                    Path(directory) / filename,
+                    match.group("notebook_id"),
+                    match.group("output_id"),
+                )
+
+
+def migrate(root: Path, layout: str, dry_run: bool = False) -> Dict[str, int]:
+    """Move every output under root to its path in layout."""
+    counts = {"moved": 0, "in_place": 0, "conflicts": 0}
+    vacated = set()
+    for path, notebook_id, output_id in list(find_outputs(root)):
+        target = root / get_output_relpath(notebook_id, output_id, layout)
+        if path == target:
+            counts["in_place"] += 1
+            continue
+        if target.exists():
+            logger.warning(f"Skipping {path}: {target} already exists")
+            counts["conflicts"] += 1
+            continue
+
+        logger.info(f"{'Would move' if dry_run else 'Moving'} {path} -> {target}")
+        if not dry_run:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+            # The cell profile sidecar moves with its notebook
+            if profile_path(path).exists():
+                os.replace(profile_path(path), profile_path(target))
+            vacated.add(path.parent)
+        counts["moved"] += 1
+
+    for directory in vacated:
+        remove_empty_parents(directory, root)
+    return counts
+
+
+def remove_empty_parents(directory: Path, root: Path) -> None:
+    """Remove directory and its parents up to root while they are empty."""
+    while directory != root and root in directory.parents:
+        try:
+            directory.rmdir()
+        except OSError:
+            # Not empty
+            return
+        directory = directory.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--layout",
+        choices=OUTPUT_LAYOUTS,
+        default=NOTEBOOK_OUTPUT_LAYOUT,
+        help="target layout (default: NOTEBOOK_OUTPUT_LAYOUT)",
+    )
+    parser.add_argument(
+        "--dir", type=Path, default=NOTEBOOKS_DIR, help="notebooks directory"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only report the moves")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    counts = migrate(args.dir, args.layout, args.dry_run)
+    print(
+        f"{'Would move' if args.dry_run else 'Moved'} {counts['moved']} outputs, "
+        f"{counts['in_place']} already in place, {counts['conflicts']} conflicts"
+    )
+
+
+if __name__ == "__main__":
+    main()
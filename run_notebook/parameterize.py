@@ -0,0 +1,255 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import nbformat
+import requests
+from nbformat.v4.rwbase import split_lines, strip_transient
+from papermill import __version__ as papermill_version
+from papermill.engines import papermill_engines
+from papermill.execute import ERROR_MARKER_TAG
+from papermill.translators import translate_parameters
+from papermill.utils import find_first_tagged_cell_index
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOK_FAST_PREPARE = os.getenv("NOTEBOOK_FAST_PREPARE", "true").lower() == "true"
+# Minimum seconds between conditional GETs of a remote source notebook
+NOTEBOOK_SOURCE_REVALIDATE_INTERVAL = float(
+    os.getenv("NOTEBOOK_SOURCE_REVALIDATE_INTERVAL", "30")
+)
+
+# Matches nbformat's JSON writer so the output is identical to papermill's
+JSON_OPTIONS = {
+    "indent": 1,
+    "sort_keys": True,
+    "separators": (",", ": "),
+    "ensure_ascii": False,
+}
+
+
+def supports_fast_prepare(path: str) -> bool:
+    """Whether a source notebook can be prepared without papermill."""
+    if "://" not in path:
+        return True
+    return path.startswith(("http://", "https://"))
+
+
+class SourceNotebook:
+    """
+    A parsed source notebook, held in the form nbformat writes it.
+
+    The cells are loaded the way papermill loads them and split into lines
+    once, so preparing an output only builds the injected-parameters cell and a
+    copy of the notebook metadata. The cached cells are shared by every output
+    and must not be modified.
+    """
+
+    def __init__(self, path: str, text: str, version: str):
+        self.path = path
+        self.version = version
+
+        nb = nbformat.reads(text, as_version=4)
+        nb = nbformat.v4.upgrade(nb) or nb
+        if "papermill" not in nb.metadata:
+            nb.metadata["papermill"] = {
+                "default_parameters": {},
+                "parameters": {},
+                "environment_variables": {},
+                "version": papermill_version,
+            }
+        for cell in nb.cells:
+            cell.metadata.setdefault("tags", [])
+            cell.metadata.setdefault("papermill", {})
+
+        # Error markers from earlier papermill runs are always dropped
+        nb.cells = [
+            cell for cell in nb.cells if ERROR_MARKER_TAG not in cell.metadata["tags"]
+        ]
+        self.parameters_index = find_first_tagged_cell_index(nb, "parameters")
+        self.injected_index = find_first_tagged_cell_index(nb, "injected-parameters")
+
+        nb = strip_transient(split_lines(nb))
+        self.nbformat = nb.nbformat
+        self.nbformat_minor = nb.nbformat_minor
+        self.metadata = nb.metadata
+        self.cells = nb.cells
+
+    @property
+    def language(self) -> str:
+        # Raises like papermill when the notebook doesn't declare a language
+        return papermill_engines.nb_language(
+            None, nbformat.NotebookNode(metadata=self.metadata)
+        )
+
+    def render(
+        self,
+        parameters: Dict[str, Any],
+        kernel_name: str,
+        output_path: str,
+    ) -> str:
+        """Serialize the notebook with parameters injected, as papermill would."""
+        cells: List[Dict[str, Any]] = self.cells
+        metadata = copy.deepcopy(self.metadata)
+
+        if parameters:
+            source = translate_parameters(
+                kernel_name, self.language, parameters, "Parameters"
+            )
+            cell = nbformat.v4.new_code_cell(source=source)
+            cell.metadata["tags"] = ["injected-parameters"]
+            cell.source = cell.source.splitlines(True)
+
+            if self.injected_index >= 0:
+                # Replace the injected cell from an earlier run
+                index = self.injected_index
+                cells = cells[:index] + [cell] + cells[index + 1 :]
+            elif self.parameters_index >= 0:
+                index = self.parameters_index + 1
+                cells = cells[:index] + [cell] + cells[index:]
+            else:
+                logger.warning(f"Notebook {self.path} has no cell tagged 'parameters'")
+                cells = [cell] + cells
+            metadata["papermill"]["parameters"] = parameters
+
+        metadata["papermill"]["input_path"] = self.path
+        metadata["papermill"]["output_path"] = output_path
+
+        return json.dumps(
+            {
+                "cells": cells,
+                "metadata": metadata,
+                "nbformat": self.nbformat,
+                "nbformat_minor": self.nbformat_minor,
+            },
+            **JSON_OPTIONS,
+        )
+
+
+class SourceNotebookCache:
+    """
+    Parsed source notebooks keyed by path.
+
+    Local files are revalidated on every lookup by mtime and size. Remote
+    notebooks are revalidated with a conditional GET on their ETag at most once
+    per revalidate_interval.
+    """
+
+    def __init__(self, revalidate_interval: float):
+        self.revalidate_interval = revalidate_interval
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.not_modified = 0
+
+    def get(self, path: str) -> SourceNotebook:
+        with self._lock:
+            entry = self._entries.get(path)
+
+        if "://" in path:
+            notebook = self._get_remote(path, entry)
+        else:
+            notebook = self._get_local(path, entry)
+        return notebook
+
+    def source_version(self, path: str) -> str:
+        """A string that changes whenever the source notebook changes."""
+        return self.get(path).version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": NOTEBOOK_FAST_PREPARE,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "loads": self.loads,
+                "not_modified": self.not_modified,
+            }
+
+    def _get_local(self, path: str, entry: Optional[Dict[str, Any]]) -> SourceNotebook:
+        stat = os.stat(path)
+        version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if entry is not None and entry["notebook"].version == version:
+            with self._lock:
+                self.hits += 1
+            return entry["notebook"]
+
+        with open(path, encoding="utf-8") as f:
+            notebook = SourceNotebook(path, f.read(), version)
+        self._store(path, {"notebook": notebook})
+        return notebook
+
+    def _get_remote(self, path: str, entry: Optional[Dict[str, Any]]) -> SourceNotebook:
+        if (
+            entry is not None
+            and time.monotonic() - entry["checked_at"] < self.revalidate_interval
+        ):
+            with self._lock:
+                self.hits += 1
+            return entry["notebook"]
+
+        headers = {"Accept": "application/json"}
+        if entry is not None and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = requests.get(path, headers=headers, timeout=30)
+        if resp.status_code == 304 and entry is not None:
+            with self._lock:
+                entry["checked_at"] = time.monotonic()
+                self.not_modified += 1
+            return entry["notebook"]
+        resp.raise_for_status()
+
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        version = etag or last_modified or hashlib.sha256(resp.content).hexdigest()
+        notebook = SourceNotebook(path, resp.text, version)
+        self._store(
+            path,
+            {
+                "notebook": notebook,
+                "etag": etag,
+                "last_modified": last_modified,
+                "checked_at": time.monotonic(),
+            },
+        )
+        return notebook
+
+    def _store(self, path: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[path] = entry
+            self.loads += 1
+        logger.info(f"Loaded source notebook {path}")
+
+
+source_notebooks = SourceNotebookCache(NOTEBOOK_SOURCE_REVALIDATE_INTERVAL)
+
+
+def prepare_notebook(
+    path: str,
+    output_path: str,
+    parameters: Dict[str, Any],
+    kernel_name: str,
+    write_path: Optional[str] = None,
+) -> None:
+    """
+    Write a parameterized copy of a source notebook without executing it.
+
+    The notebook records output_path as its location; it is written to
+    write_path instead when one is given.
+    """
+    text = source_notebooks.get(path).render(parameters, kernel_name, output_path)
+    with open(write_path or output_path, "w", encoding="utf-8") as f:
+        f.write(text)
@@ -0,0 +1,229 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOK_PROFILE_CELLS = os.getenv("NOTEBOOK_PROFILE_CELLS", "true").lower() == "true"
+# Runs per notebook kept in memory for GET /notebooks/{id}/profile
+NOTEBOOK_PROFILE_HISTORY = int(os.getenv("NOTEBOOK_PROFILE_HISTORY", "500"))
+
+PROFILE_SUFFIX = ".profile.json"
+INJECTED_PARAMETERS_TAG = "injected-parameters"
+PROFILE_METRICS = ("wall_seconds", "cpu_seconds", "peak_rss_delta_bytes", "read_bytes")
+PERCENTILES = (50, 90, 99)
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def read_process_usage(pid: int) -> Optional[Dict[str, int]]:
+    """
+    CPU ticks, current and peak RSS and bytes read from storage so far by a
+    process, from /proc.
+
+    Returns None where /proc isn't available or the process has gone.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name can contain spaces, so split after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        usage = {"cpu_ticks": int(fields[11]) + int(fields[12])}
+
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    usage["peak_rss"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmRSS:"):
+                    usage["rss"] = int(line.split()[1]) * 1024
+
+        # read_bytes rather than rchar, which also counts the kernel's sockets
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                if line.startswith("read_bytes:"):
+                    usage["read_bytes"] = int(line.split()[1])
+                    break
+        return usage
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    """Reset a process's peak RSS (VmHWM) to its current RSS."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class CellProfiler:
+    """
+    Measures the kernel process's resource use across each cell.
+
+    Pooled kernels are reused, so the peak RSS is reset before every cell;
+    where that isn't allowed the RSS growth over the cell is reported instead.
+    """
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self._started: Dict[int, Any] = {}
+
+    def start(self, cell_index: int) -> None:
+        peak_reset = reset_peak_rss(self.pid) if self.pid else False
+        usage = read_process_usage(self.pid) if self.pid else None
+        self._started[cell_index] = (time.monotonic(), usage, peak_reset)
+
+    def finish(self, cell_index: int) -> Optional[Dict[str, Any]]:
+        started = self._started.pop(cell_index, None)
+        if started is None:
+            return None
+
+        start, before, peak_reset = started
+        profile = {"wall_seconds": round(time.monotonic() - start, 6)}
+        after = read_process_usage(self.pid) if before is not None else None
+        if after is not None:
+            profile["cpu_seconds"] = round(
+                (after["cpu_ticks"] - before["cpu_ticks"]) / CLOCK_TICKS, 6
+            )
+            if peak_reset and "peak_rss" in after and "rss" in before:
+                profile["peak_rss_delta_bytes"] = after["peak_rss"] - before["rss"]
+                profile["peak_rss_bytes"] = after["peak_rss"]
+            elif "rss" in after and "rss" in before:
+                profile["peak_rss_delta_bytes"] = after["rss"] - before["rss"]
+            if "read_bytes" in after and "read_bytes" in before:
+                profile["read_bytes"] = after["read_bytes"] - before["read_bytes"]
+        return profile
+
+
+def kernel_pid(km: Any) -> Optional[int]:
+    """The process ID of a locally provisioned kernel, if there is one."""
+    process = getattr(getattr(km, "provisioner", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+def cell_profiles(nb: Any) -> List[Dict[str, Any]]:
+    """
+    Collect the per-cell profiles recorded in an executed notebook.
+
+    Cells are numbered as in the source notebook: papermill's injected
+    parameters cell isn't counted, so the same cell keeps its index whether or
+    not a run had parameters injected.
+    """
+    profiles = []
+    source_index = 0
+    for cell in nb.cells:
+        if INJECTED_PARAMETERS_TAG in cell.metadata.get("tags", []):
+            continue
+        if "profile" in cell.metadata:
+            profiles.append(
+                {
+                    "source_index": source_index,
+                    "cell_id": cell.get("id"),
+                    **cell.metadata["profile"],
+                }
+            )
+        source_index += 1
+    return profiles
+
+
+def profile_path(output_path: Path) -> Path:
+    """Path of the profile sidecar written next to an output notebook."""
+    return output_path.with_name(output_path.name[: -len(".ipynb")] + PROFILE_SUFFIX)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+class ProfileStore:
+    """
+    Recent cell profiles per notebook ID, for percentile reports.
+
+    Profiles are added as runs finish. The first report for a notebook also
+    loads the sidecars already on disk, so history survives restarts.
+    """
+
+    def __init__(self, history: int = NOTEBOOK_PROFILE_HISTORY):
+        self.history = history
+        self._runs: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._loaded: set = set()
+        self._lock = threading.Lock()
+
+    def add(self, notebook_id: str, run: Dict[str, Any]) -> None:
+        with self._lock:
+            self._runs_for(notebook_id).append(run)
+
+    def load(self, notebook_id: str, sidecars: Iterable[Path]) -> None:
+        """Seed a notebook's history from its sidecars, once."""
+        with self._lock:
+            if notebook_id in self._loaded:
+                return
+
+        runs = []
+        for path in sidecars:
+            try:
+                runs.append(json.loads(path.read_text()))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable profile {path}: {e}")
+        runs.sort(key=lambda run: run.get("finished_at", 0))
+
+        with self._lock:
+            if notebook_id in self._loaded:
+                return
+            self._loaded.add(notebook_id)
+            known = {run.get("output_id") for run in self._runs_for(notebook_id)}
+            loaded = [run for run in runs if run.get("output_id") not in known]
+            self._runs[notebook_id] = deque(
+                loaded + list(self._runs_for(notebook_id)), maxlen=self.history
+            )
+
+    def report(self, notebook_id: str, last: Optional[int] = None) -> Dict[str, Any]:
+        """Percentiles of each metric per source cell index over the recent runs."""
+        with self._lock:
+            runs = list(self._runs.get(notebook_id, ()))
+        if last:
+            runs = runs[-last:]
+
+        by_cell: Dict[int, Dict[str, List[float]]] = {}
+        for run in runs:
+            for cell in run.get("cells", []):
+                metrics = by_cell.setdefault(cell["source_index"], {})
+                for name in PROFILE_METRICS:
+                    if cell.get(name) is not None:
+                        metrics.setdefault(name, []).append(cell[name])
+
+        cells = []
+        for source_index in sorted(by_cell):
+            summary = {"source_index": source_index}
+            for name, values in by_cell[source_index].items():
+                values.sort()
+                summary[name] = {
+                    "count": len(values),
+                    **{f"p{q}": percentile(values, q) for q in PERCENTILES},
+                    "max": values[-1],
+                }
+            cells.append(summary)
+
+        return {"notebook_id": notebook_id, "runs": len(runs), "cells": cells}
+
+    def _runs_for(self, notebook_id: str) -> Deque[Dict[str, Any]]:
+        # Called with the lock held
+        runs = self._runs.get(notebook_id)
+        if runs is None:
+            runs = self._runs[notebook_id] = deque(maxlen=self.history)
+        return runs
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,312 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from run_notebook.profiling import profile_path
+
+logger = logging.getLogger(__name__)
+
+# Policies; 0 disables a policy
+NOTEBOOK_RETENTION_MAX_AGE = float(os.getenv("NOTEBOOK_RETENTION_MAX_AGE", "0"))
+NOTEBOOK_RETENTION_MAX_BYTES = int(os.getenv("NOTEBOOK_RETENTION_MAX_BYTES", "0"))
+NOTEBOOK_RETENTION_MAX_FILES = int(os.getenv("NOTEBOOK_RETENTION_MAX_FILES", "0"))
+NOTEBOOK_RETENTION_INTERVAL = float(os.getenv("NOTEBOOK_RETENTION_INTERVAL", "300"))
+# Outputs used more recently than this are never deleted
+NOTEBOOK_RETENTION_GRACE = float(os.getenv("NOTEBOOK_RETENTION_GRACE", "300"))
+# Directory entries examined between short pauses while scanning
+NOTEBOOK_RETENTION_SCAN_BATCH = int(os.getenv("NOTEBOOK_RETENTION_SCAN_BATCH", "500"))
+NOTEBOOK_RETENTION_SCAN_PAUSE = float(
+    os.getenv("NOTEBOOK_RETENTION_SCAN_PAUSE", "0.01")
+)
+# Seconds between full scans of the output tree. In between, runs work from an
+# in-memory index kept up to date as outputs are written, reused and viewed;
+# full scans pick up changes made by other processes and stale temporary files
+NOTEBOOK_RETENTION_RESCAN_INTERVAL = float(
+    os.getenv("NOTEBOOK_RETENTION_RESCAN_INTERVAL", "86400")
+)
+
+# Temporary files left behind by a crashed run are removed after this long
+TEMP_FILE_MAX_AGE = 24 * 3600
+
+
+def touch_output(path: Path) -> Optional[os.stat_result]:
+    """
+    Mark an output as used now by bumping its access time. The modification
+    time is kept, so it still records when the output was written.
+    """
+    try:
+        stat = path.stat()
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError as e:
+        logger.debug(f"Could not record use of {path}: {e}")
+        return None
+    return stat
+
+
+class OutputRetention:
+    """
+    Background garbage collection of output notebooks.
+
+    Outputs are ranked by when they were last used: written, reused or viewed
+    (see record_use). Each run deletes outputs older than max_age, then the
+    least recently used ones until the directory is within max_bytes and
+    max_files.
+
+    Runs work from an LRU index of the outputs that record_use keeps current,
+    so a sweep only touches the outputs it deletes. The index is rebuilt from a
+    full scan on the first run and every rescan_interval seconds after; the
+    tree is scanned in batches with short pauses so it doesn't saturate the
+    disk.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        max_age: float = NOTEBOOK_RETENTION_MAX_AGE,
+        max_bytes: int = NOTEBOOK_RETENTION_MAX_BYTES,
+        max_files: int = NOTEBOOK_RETENTION_MAX_FILES,
+        interval: float = NOTEBOOK_RETENTION_INTERVAL,
+        grace: float = NOTEBOOK_RETENTION_GRACE,
+        scan_batch: int = NOTEBOOK_RETENTION_SCAN_BATCH,
+        scan_pause: float = NOTEBOOK_RETENTION_SCAN_PAUSE,
+        rescan_interval: float = NOTEBOOK_RETENTION_RESCAN_INTERVAL,
+    ):
+        self.root = root
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.interval = interval
+        self.grace = grace
+        self.scan_batch = scan_batch
+        self.scan_pause = scan_pause
+        self.rescan_interval = rescan_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # path -> (last_used, size), least recently used first; None until the
+        # first full scan
+        self._index: Optional[OrderedDict[str, Tuple[float, int]]] = None
+        self._index_bytes = 0
+        self._last_scan = 0.0
+        self.runs = 0
+        self.scans = 0
+        self.files_deleted = 0
+        self.bytes_reclaimed = 0
+        self.errors = 0
+        self.last_run: Dict[str, Any] = {}
+        self.total_run_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age > 0 or self.max_bytes > 0 or self.max_files > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run_periodically, name="notebook-retention", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def record_use(self, path: Path) -> None:
+        """Mark an output as used now, on disk and in the index."""
+        stat = touch_output(path)
+        if stat is None or not self.enabled:
+            return
+        with self._lock:
+            if self._index is not None:
+                self._index_put(str(path), time.time(), stat.st_size)
+
+    def run_once(self) -> Dict[str, Any]:
+        """Apply the retention policies once and return what was done."""
+        start = time.monotonic()
+        now = time.time()
+        if self._index is None or start - self._last_scan >= self.rescan_interval:
+            self._rebuild_index(now)
+        with self._lock:
+            outputs = list(self._index.items())
+            total_bytes = self._index_bytes
+        total_files = len(outputs)
+
+        deleted = 0
+        reclaimed = 0
+        errors = 0
+        for path, (last_used, size) in outputs:
+            if self._stop.is_set():
+                break
+            if last_used > now - self.grace:
+                # Oldest first, so everything after this is in use too
+                break
+
+            expired = self.max_age > 0 and last_used < now - self.max_age
+            over_bytes = self.max_bytes > 0 and total_bytes > self.max_bytes
+            over_files = self.max_files > 0 and total_files > self.max_files
+            if not (expired or over_bytes or over_files):
+                break
+
+            if self._used_since(path, last_used):
+                # Used by another process; the index has caught up now
+                continue
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete output {path}: {e}")
+                errors += 1
+                continue
+            with self._lock:
+                self._index_remove(path)
+            reclaimed += self._delete_sidecar(path)
+            deleted += 1
+            reclaimed += size
+            total_bytes -= size
+            total_files -= 1
+
+        seconds = time.monotonic() - start
+        result = {
+            "finished_at": time.time(),
+            "seconds": round(seconds, 3),
+            "files": total_files,
+            "bytes": total_bytes,
+            "files_deleted": deleted,
+            "bytes_reclaimed": reclaimed,
+            "errors": errors,
+        }
+        with self._lock:
+            self.runs += 1
+            self.files_deleted += deleted
+            self.bytes_reclaimed += reclaimed
+            self.errors += errors
+            self.total_run_seconds += seconds
+            self.last_run = result
+
+        if deleted:
+            logger.info(
+                f"Deleted {deleted} output notebooks ({reclaimed} bytes) "
+                f"in {seconds:.2f}s"
+            )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_age": self.max_age,
+                "max_bytes": self.max_bytes,
+                "max_files": self.max_files,
+                "runs": self.runs,
+                "scans": self.scans,
+                "indexed": len(self._index) if self._index is not None else None,
+                "files_deleted": self.files_deleted,
+                "bytes_reclaimed": self.bytes_reclaimed,
+                "errors": self.errors,
+                "total_run_seconds": round(self.total_run_seconds, 3),
+                "last_run": dict(self.last_run),
+            }
+
+    def _delete_sidecar(self, path: str) -> int:
+        # The cell profile written next to an executed notebook
+        sidecar = profile_path(Path(path))
+        try:
+            size = sidecar.stat().st_size
+            sidecar.unlink()
+        except OSError:
+            return 0
+        return size
+
+    def _rebuild_index(self, now: float) -> None:
+        scan_start = time.time()
+        scanned = {path: (last_used, size) for last_used, size, path in self._scan(now)}
+        with self._lock:
+            # Keep uses recorded while the scan was running
+            for path, (last_used, size) in (self._index or {}).items():
+                if path in scanned:
+                    scanned_last_used, size = scanned[path]
+                    scanned[path] = (max(last_used, scanned_last_used), size)
+                elif last_used >= scan_start:
+                    scanned[path] = (last_used, size)
+            self._index = OrderedDict(
+                sorted(scanned.items(), key=lambda item: item[1][0])
+            )
+            self._index_bytes = sum(size for _, size in scanned.values())
+            self._last_scan = time.monotonic()
+            self.scans += 1
+
+    def _index_put(self, path: str, last_used: float, size: int) -> None:
+        # Called with the lock held; the entry moves to the most recent end
+        self._index_remove(path)
+        self._index[path] = (last_used, size)
+        self._index_bytes += size
+
+    def _index_remove(self, path: str) -> None:
+        # Called with the lock held
+        entry = self._index.pop(path, None)
+        if entry is not None:
+            self._index_bytes -= entry[1]
+
+    def _used_since(self, path: str, last_used: float) -> bool:
+        """Whether the file on disk was used after the index says it was."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        disk_last_used = max(stat.st_mtime, stat.st_atime)
+        if os.path.basename(path).startswith(".") or disk_last_used <= last_used:
+            return False
+        with self._lock:
+            self._index_put(path, disk_last_used, stat.st_size)
+        return True
+
+    def _run_periodically(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Output retention run failed: {e}")
+
+    def _scan(self, now: float) -> Iterator[Tuple[float, int, str]]:
+        """Yield (last_used, size, path) for every output under the root."""
+        pending: List[str] = [str(self.root)]
+        examined = 0
+        while pending and not self._stop.is_set():
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+
+            for entry in entries:
+                examined += 1
+                if examined % self.scan_batch == 0:
+                    time.sleep(self.scan_pause)
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    if not entry.name.endswith(".ipynb"):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                last_used = max(stat.st_mtime, stat.st_atime)
+                if entry.name.startswith("."):
+                    # A run's temporary file; only stale ones are collected
+                    if stat.st_mtime > now - TEMP_FILE_MAX_AGE:
+                        continue
+                    last_used = 0.0
+                yield last_used, stat.st_size, entry.path
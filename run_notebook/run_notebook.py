@@ -1,188 +1,870 @@
 import papermill as pm
+from papermill.exceptions import PapermillExecutionError
 import uuid
 import os
+import re
+import json
+import hashlib
+import itertools
+import random
 import requests
 import time
 import logging
-from typing import Dict, Any
-from fastapi import Request, HTTPException
+import threading
+from typing import Callable, Dict, Any, List, Mapping, Optional, Tuple
+from fastapi import HTTPException
 import jupyter_client
 from pathlib import Path
+from create_qlr.singleflight import SingleFlight
+from metrics import DURATION_BUCKETS, counter, histogram
+from run_notebook.engine import POOLED_ENGINE_NAME
+from run_notebook.kernel_pool import get_kernel_pool
+from run_notebook.parameterize import (
+    NOTEBOOK_FAST_PREPARE,
+    prepare_notebook,
+    source_notebooks,
+    supports_fast_prepare,
+)
+from run_notebook.profiling import (
+    NOTEBOOK_PROFILE_CELLS,
+    PROFILE_SUFFIX,
+    cell_profiles,
+    profile_path,
+    profile_store,
+)
+from run_notebook.retention import OutputRetention
+from tracing import span, traced
 
 logger = logging.getLogger(__name__)
 
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class NotebookNotFoundError(ValueError):
+    """Raised when a notebook ID isn't in the config."""
+
+
+class NotebookExecutionError(Exception):
+    """Raised when a cell fails; output_id is the kept, partially run notebook."""
+
+    def __init__(self, message: str, output_id: Optional[str]):
+        super().__init__(message)
+        self.output_id = output_id
+
+
 CONFIG_URL = "https://raw.githubusercontent.com/geodowd/notebook_config/refs/heads/main/config.json"
-CONFIG_CACHE_DURATION = 300  # 5 minutes
-_config_cache = {"data": None, "timestamp": 0}
+CONFIG_CACHE_DURATION = int(os.getenv("CONFIG_CACHE_DURATION", "300"))  # 5 minutes
+# The config is refreshed in the background once it is this old, ahead of expiry
+CONFIG_REFRESH_INTERVAL = float(
+    os.getenv("CONFIG_REFRESH_INTERVAL", str(CONFIG_CACHE_DURATION * 0.8))
+)
+# First retry delay after a failed fetch; doubles per failure up to the interval
+CONFIG_RETRY_BACKOFF = float(os.getenv("CONFIG_RETRY_BACKOFF", "5"))
+_config_cache = {
+    "data": None,
+    "index": {},
+    "timestamp": 0,
+    "etag": None,
+    "last_modified": None,
+    "refreshes": 0,
+    "not_modified": 0,
+    "failures": 0,
+    "consecutive_failures": 0,
+    # No fetch is attempted before this time, set after a failure
+    "next_attempt": 0.0,
+    "last_error": None,
+}
+_config_refresh_lock = threading.Lock()
+# Lookups waiting on the first config fetch share one request and its result
+config_fetch_flights = SingleFlight()
+
+config_fetch_seconds = histogram(
+    "notebook_config_fetch_seconds", "Notebook config fetch latency", ["result"]
+)
+notebook_run_seconds = histogram(
+    "notebook_run_seconds",
+    "Time to prepare or execute a notebook output",
+    ["notebook_id", "mode"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25) + DURATION_BUCKETS,
+)
+notebook_outputs = counter(
+    "notebook_outputs", "Notebook outputs by result", ["notebook_id", "result"]
+)
+
+# "prepare" only injects parameters; "execute" runs the notebook on a pooled kernel
+NOTEBOOK_EXECUTION_MODE = os.getenv("NOTEBOOK_EXECUTION_MODE", "prepare").lower()
+NOTEBOOK_EXECUTION_TIMEOUT = int(os.getenv("NOTEBOOK_EXECUTION_TIMEOUT", "600"))
+
+# Identical runs share one output unless the request passes reuse=false
+NOTEBOOK_OUTPUT_REUSE = os.getenv("NOTEBOOK_OUTPUT_REUSE", "true").lower() == "true"
+REUSE_QUERY_PARAM = "reuse"
+
+NOTEBOOK_BATCH_MAX_SIZE = int(os.getenv("NOTEBOOK_BATCH_MAX_SIZE", "100"))
+_output_stats = {"created": 0, "reused": 0}
+
+NOTEBOOKS_DIR = Path("notebooks")
+# "flat" keeps every output in notebooks/; "sharded" nests them by notebook ID
+# and output ID prefix (migrate with python -m run_notebook.migrate_layout)
+NOTEBOOK_OUTPUT_LAYOUT = os.getenv("NOTEBOOK_OUTPUT_LAYOUT", "flat").lower()
+OUTPUT_LAYOUTS = ("flat", "sharded")
+OUTPUT_ID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+output_retention = OutputRetention(NOTEBOOKS_DIR)
+
+
+def index_notebook_config(
+    config: List[Dict[str, Any]],
+) -> Dict[Tuple[Any, Any], Dict[str, Any]]:
+    """Index config entries by (type, id); the first entry for a key wins."""
+    index = {}
+    for entry in config:
+        if isinstance(entry, dict):
+            index.setdefault((entry.get("type"), entry.get("id")), entry)
+    return index
+
+
+@traced("fetch_notebook_config")
+def refresh_notebook_config() -> None:
+    """
+    Fetch the notebook configuration, using a conditional GET so an unchanged
+    config costs a single 304. Raises requests.RequestException on failure.
+    """
+    headers = {}
+    if _config_cache["etag"]:
+        headers["If-None-Match"] = _config_cache["etag"]
+    if _config_cache["last_modified"]:
+        headers["If-Modified-Since"] = _config_cache["last_modified"]
 
+    start = time.perf_counter()
+    try:
+        resp = requests.get(CONFIG_URL, headers=headers, timeout=10)
+        if resp.status_code == 304 and _config_cache["data"] is not None:
+            config_fetch_seconds.observe(
+                time.perf_counter() - start, result="not_modified"
+            )
+            _config_cache.update(
+                timestamp=time.time(), consecutive_failures=0, next_attempt=0.0
+            )
+            _config_cache["not_modified"] += 1
+            logger.debug("Notebook configuration unchanged")
+            return
+
+        resp.raise_for_status()
+        config = resp.json()
+        if not isinstance(config, list):
+            raise requests.RequestException("Notebook configuration is not a list")
+    except (requests.RequestException, ValueError) as e:
+        config_fetch_seconds.observe(time.perf_counter() - start, result="error")
+        _config_cache["failures"] += 1
+        _config_cache["last_error"] = str(e)
+        _back_off()
+        raise requests.RequestException(str(e)) from e
+
+    config_fetch_seconds.observe(time.perf_counter() - start, result="updated")
+    index = index_notebook_config(config)
+    # Swap the whole config in one go; readers see either the old or new copy
+    _config_cache.update(
+        data=config,
+        index=index,
+        timestamp=time.time(),
+        etag=resp.headers.get("ETag"),
+        last_modified=resp.headers.get("Last-Modified"),
+        last_error=None,
+        consecutive_failures=0,
+        next_attempt=0.0,
+    )
+    _config_cache["refreshes"] += 1
+    logger.info("Notebook configuration loaded and cached")
 
-def get_notebook_config(notebook_id: str) -> Dict[str, Any]:
-    """Get notebook configuration by ID with caching"""
-    current_time = time.time()
-
-    # Check if cache is valid
-    if (
-        _config_cache["data"] is not None
-        and current_time - _config_cache["timestamp"] < CONFIG_CACHE_DURATION
-    ):
-        config = _config_cache["data"]
-    else:
+
+def _back_off() -> None:
+    # Exponential backoff with jitter, so an outage isn't hit every second
+    _config_cache["consecutive_failures"] += 1
+    delay = min(
+        CONFIG_REFRESH_INTERVAL,
+        CONFIG_RETRY_BACKOFF * 2 ** (_config_cache["consecutive_failures"] - 1),
+    )
+    delay = random.uniform(delay / 2, delay)
+    _config_cache["next_attempt"] = time.time() + delay
+    logger.info(f"Next notebook config fetch in {delay:.1f}s")
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh_notebook_config()
+    except requests.RequestException as e:
+        logger.warning(f"Background config refresh failed, serving stale copy: {e}")
+    finally:
+        _config_refresh_lock.release()
+
+
+def schedule_config_refresh() -> bool:
+    """
+    Start a background refresh unless one is already in flight or a failed
+    fetch is backing off.
+    """
+    if time.time() < _config_cache["next_attempt"]:
+        return False
+    if not _config_refresh_lock.acquire(blocking=False):
+        return False
+    threading.Thread(
+        target=_refresh_in_background, name="config-refresh", daemon=True
+    ).start()
+    return True
+
+
+def start_config_refresher() -> None:
+    """Keep the notebook configuration fresh from a background thread."""
+
+    def refresh_periodically():
+        while True:
+            due = max(
+                _config_cache["timestamp"] + CONFIG_REFRESH_INTERVAL,
+                _config_cache["next_attempt"],
+            )
+            if time.time() >= due:
+                schedule_config_refresh()
+            time.sleep(max(1.0, min(due - time.time(), 60)))
+
+    threading.Thread(
+        target=refresh_periodically, name="config-refresher", daemon=True
+    ).start()
+
+
+def notebook_label(notebook_id: str) -> str:
+    """Notebook ID as a metric label; IDs not in the config share one series."""
+    if ("notebook", notebook_id) in _config_cache["index"]:
+        return notebook_id
+    return "other"
+
+
+def notebook_config_stats() -> Dict[str, Any]:
+    timestamp = _config_cache["timestamp"]
+    return {
+        "loaded": _config_cache["data"] is not None,
+        "entries": len(_config_cache["index"]),
+        "age": round(time.time() - timestamp, 3) if timestamp else None,
+        "etag": _config_cache["etag"],
+        "refreshes": _config_cache["refreshes"],
+        "not_modified": _config_cache["not_modified"],
+        "failures": _config_cache["failures"],
+        "consecutive_failures": _config_cache["consecutive_failures"],
+        "retry_in": max(0.0, round(_config_cache["next_attempt"] - time.time(), 3)),
+        "last_error": _config_cache["last_error"],
+        "refresh_in_flight": _config_refresh_lock.locked(),
+        "coalesced": config_fetch_flights.coalesced,
+    }
+
+
+def _load_notebook_config() -> None:
+    # Also wait out a background refresh that is already fetching
+    with _config_refresh_lock:
+        if _config_cache["data"] is not None:
+            return
+        if time.time() < _config_cache["next_attempt"]:
+            raise HTTPException(
+                status_code=500, detail="Failed to fetch notebook configuration"
+            )
         try:
-            resp = requests.get(CONFIG_URL, timeout=10)
-            resp.raise_for_status()
-            config = resp.json()
-            _config_cache["data"] = config
-            _config_cache["timestamp"] = current_time
-            logger.info("Notebook configuration loaded and cached")
+            refresh_notebook_config()
         except requests.RequestException as e:
             logger.error(f"Failed to fetch config: {e}")
             raise HTTPException(
                 status_code=500, detail="Failed to fetch notebook configuration"
             )
 
+
+@traced()
+def get_notebook_config(notebook_id: str) -> Dict[str, Any]:
+    """
+    Get notebook configuration by ID from the cached, indexed config.
+
+    Only the very first lookup waits on the network. After that a stale config
+    triggers a background refresh and keeps being served until it succeeds.
+    """
+    if _config_cache["data"] is None:
+        config_fetch_flights.do(CONFIG_URL, _load_notebook_config)
+    elif time.time() - _config_cache["timestamp"] >= CONFIG_CACHE_DURATION:
+        schedule_config_refresh()
+
     # Validate notebook ID
     if not notebook_id or not isinstance(notebook_id, str):
         raise ValueError("Notebook ID must be a non-empty string")
 
     # Find notebook
-    notebook = next(
-        (
-            nb
-            for nb in config
-            if nb.get("type") == "notebook" and nb.get("id") == notebook_id
-        ),
-        None,
-    )
+    notebook = _config_cache["index"].get(("notebook", notebook_id))
 
     if not notebook:
-        raise ValueError(f"Notebook id '{notebook_id}' not found in config.")
+        raise NotebookNotFoundError(f"Notebook id '{notebook_id}' not found in config.")
 
     return notebook
 
 
-def parse_parameters(request: Request, input_spec: Dict[str, str]) -> Dict[str, Any]:
-    """Parse and validate parameters from request query params with proper error handling."""
-    query_params = dict(request.query_params)
+@traced()
+def parse_parameters(
+    query_params: Mapping[str, str], input_spec: Dict[str, str], strict: bool = False
+) -> Dict[str, Any]:
+    """
+    Parse and validate parameters from request query params with proper error handling.
+
+    Invalid values are logged and skipped, or with strict raise ValueError so a
+    request can be rejected before it is queued.
+    """
+    query_params = dict(query_params)
     parameters = {}
 
+    def invalid(message: str) -> None:
+        if strict:
+            raise ValueError(message)
+        logger.warning(message)
+
     for param, param_type in input_spec.items():
         if param not in query_params:
             continue
 
         value = query_params[param]
 
-        try:
-            if param_type == "bbox":
-                # Validate bbox format: minx,miny,maxx,maxy
+        if param_type == "bbox":
+            # Validate bbox format: minx,miny,maxx,maxy
+            try:
                 coords = [float(x) for x in value.split(",")]
-                if len(coords) != 4:
-                    logger.warning(f"Invalid bbox format for {param}: {value}")
-                    continue
-                parameters[param] = coords
-            elif param_type == "urlList":
-                # Validate URL list
-                urls = [url.strip() for url in value.split(",") if url.strip()]
-                if not urls:
-                    logger.warning(f"Empty URL list for {param}")
-                    continue
-                parameters[param] = urls
-            else:
-                # Basic string validation
-                if not value.strip():
-                    logger.warning(f"Empty value for {param}")
-                    continue
-                parameters[param] = value.strip()
-        except ValueError as e:
-            logger.warning(f"Invalid parameter {param}: {e}")
-            continue
+            except ValueError:
+                coords = None
+            if coords is None or len(coords) != 4:
+                invalid(f"Invalid bbox format for {param}: {value}")
+                continue
+            parameters[param] = coords
+        elif param_type == "urlList":
+            # Validate URL list
+            urls = [url.strip() for url in value.split(",") if url.strip()]
+            if not urls:
+                invalid(f"Empty URL list for {param}")
+                continue
+            parameters[param] = urls
+        else:
+            # Basic string validation
+            if not value.strip():
+                invalid(f"Empty value for {param}")
+                continue
+            parameters[param] = value.strip()
 
     return parameters
 
 
-def get_default_kernel_name() -> str:
-    """Get the default kernel name from available kernels."""
-    try:
-        kernels = jupyter_client.kernelspec.KernelSpecManager()
-        kernel_specs = kernels.get_all_specs()
-
-        # Priority order for kernel selection
-        preferred_kernels = [
-            "python3 (ipykernel)",
-            "python3",
-            "python",
-            "jupyter-python3",
-        ]
+# Preferred kernels for notebooks that don't name one, in priority order
+PREFERRED_KERNELS = [
+    "python3 (ipykernel)",
+    "python3",
+    "python",
+    "jupyter-python3",
+]
+# Minimum seconds between checks of the kernelspec directories for changes
+KERNEL_SPEC_CHECK_INTERVAL = float(os.getenv("KERNEL_SPEC_CHECK_INTERVAL", "30"))
+_kernel_cache = {
+    "specs": None,
+    "default": None,
+    "dirs": [],
+    "signature": None,
+    "checked_at": 0,
+    "overrides": {},
+}
+_kernel_lock = threading.Lock()
+
+
+def _kernel_dirs_signature(kernel_dirs: List[str]) -> Tuple:
+    # A kernelspec directory's mtime changes when kernels are added or removed
+    signature = []
+    for kernel_dir in kernel_dirs:
+        try:
+            signature.append((kernel_dir, os.stat(kernel_dir).st_mtime_ns))
+        except OSError:
+            signature.append((kernel_dir, None))
+    return tuple(signature)
 
-        for kernel_name in preferred_kernels:
-            if kernel_name in kernel_specs:
-                logger.info(f"Using kernel: {kernel_name}")
-                return kernel_name
 
-        # Fallback to first available kernel
-        if kernel_specs:
-            kernel_name = list(kernel_specs.keys())[0]
-            logger.info(f"Using fallback kernel: {kernel_name}")
+def _select_default_kernel(kernel_specs: Dict[str, str]) -> str:
+    for kernel_name in PREFERRED_KERNELS:
+        if kernel_name in kernel_specs:
+            logger.info(f"Using kernel: {kernel_name}")
             return kernel_name
-        else:
-            logger.warning("No kernels available, using default python3")
-            return "python3"
+
+    # Fallback to first available kernel
+    if kernel_specs:
+        kernel_name = list(kernel_specs.keys())[0]
+        logger.info(f"Using fallback kernel: {kernel_name}")
+        return kernel_name
+
+    logger.warning("No kernels available, using default python3")
+    return "python3"
+
+
+@traced()
+def reload_kernels() -> Dict[str, Any]:
+    """Rediscover the installed kernelspecs and reselect the default kernel."""
+    with _kernel_lock:
+        try:
+            manager = jupyter_client.kernelspec.KernelSpecManager()
+            kernel_dirs = list(manager.kernel_dirs)
+            kernel_specs = manager.find_kernel_specs()
+        except Exception as e:
+            logger.warning(f"Failed to detect kernel: {e}, using default python3")
+            kernel_dirs, kernel_specs = [], {}
+
+        _kernel_cache.update(
+            specs=kernel_specs,
+            default=_select_default_kernel(kernel_specs),
+            dirs=kernel_dirs,
+            signature=_kernel_dirs_signature(kernel_dirs),
+            checked_at=time.monotonic(),
+            overrides={},
+        )
+        return kernel_info()
+
+
+def kernel_info() -> Dict[str, Any]:
+    return {
+        "default": _kernel_cache["default"],
+        "available": sorted(_kernel_cache["specs"] or {}),
+        "overrides": {
+            notebook_id: kernel_name
+            for notebook_id, (_, kernel_name) in _kernel_cache["overrides"].items()
+        },
+    }
+
+
+def _ensure_kernels_loaded() -> None:
+    if _kernel_cache["specs"] is None:
+        reload_kernels()
+        return
+
+    if time.monotonic() - _kernel_cache["checked_at"] < KERNEL_SPEC_CHECK_INTERVAL:
+        return
+
+    _kernel_cache["checked_at"] = time.monotonic()
+    if _kernel_dirs_signature(_kernel_cache["dirs"]) != _kernel_cache["signature"]:
+        logger.info("Kernelspec directories changed, reloading kernels")
+        reload_kernels()
+
+
+def get_default_kernel_name() -> str:
+    """Get the default kernel name from the cached kernelspecs."""
+    _ensure_kernels_loaded()
+    return _kernel_cache["default"]
+
+
+@traced()
+def get_kernel_name(notebook: Dict[str, Any]) -> str:
+    """
+    Get the kernel for a notebook config entry: its "kernel" override when that
+    kernel is installed, otherwise the default kernel.
+    """
+    _ensure_kernels_loaded()
+    override = notebook.get("kernel")
+    if not override:
+        return _kernel_cache["default"]
+
+    notebook_id = notebook.get("id")
+    cached = _kernel_cache["overrides"].get(notebook_id)
+    if cached is not None and cached[0] == override:
+        return cached[1]
+
+    if override in _kernel_cache["specs"]:
+        kernel_name = override
+    else:
+        logger.warning(
+            f"Kernel '{override}' for notebook {notebook_id} is not "
+            f"installed, using {_kernel_cache['default']}"
+        )
+        kernel_name = _kernel_cache["default"]
+    _kernel_cache["overrides"][notebook_id] = (override, kernel_name)
+    return kernel_name
+
+
+def get_output_relpath(
+    notebook_id: str, output_id: str, layout: str = NOTEBOOK_OUTPUT_LAYOUT
+) -> str:
+    """Path of an output notebook relative to the notebooks directory."""
+    filename = f"{notebook_id}-{output_id}.ipynb"
+    if layout == "sharded":
+        return f"{notebook_id}/{output_id[:2]}/{filename}"
+    return filename
+
+
+def get_output_path(notebook_id: str, output_id: str) -> Path:
+    """Path of an output notebook."""
+    return NOTEBOOKS_DIR / get_output_relpath(notebook_id, output_id)
+
+
+def record_output_use(notebook_id: str, output_id: str) -> None:
+    """Mark an output as recently used so retention keeps it."""
+    output_retention.record_use(get_output_path(notebook_id, output_id))
+
+
+def wants_reuse(query_params: Mapping[str, str]) -> bool:
+    return (
+        NOTEBOOK_OUTPUT_REUSE
+        and query_params.get(REUSE_QUERY_PARAM, "true").lower() != "false"
+    )
+
+
+@traced()
+def output_key(
+    notebook_id: str,
+    notebook: Dict[str, Any],
+    parameters: Dict[str, Any],
+    kernel_name: str,
+) -> Optional[str]:
+    """
+    Deterministic output ID for a run, derived from the notebook ID, the source
+    notebook version and the parsed parameters.
+
+    Returns None for sources whose version can't be checked cheaply.
+    """
+    if not supports_fast_prepare(notebook["file"]):
+        return None
+
+    key = json.dumps(
+        {
+            "notebook_id": notebook_id,
+            "source": source_notebooks.source_version(notebook["file"]),
+            "parameters": parameters,
+            "kernel": kernel_name,
+            "mode": NOTEBOOK_EXECUTION_MODE,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return str(uuid.UUID(hex=hashlib.sha256(key.encode()).hexdigest()[:32]))
+
+
+def _resolve_run(
+    notebook_id: str, query_params: Mapping[str, str]
+) -> Tuple[Dict[str, Any], Dict[str, Any], str, Optional[str]]:
+    # Get notebook config and inputSpec
+    notebook = get_notebook_config(notebook_id)
+    input_spec = notebook.get("inputSpec", {})
+
+    # Extract and parse parameters
+    parameters = parse_parameters(query_params, input_spec)
+
+    # Get kernel name
+    kernel_name = get_kernel_name(notebook)
+
+    key = None
+    if wants_reuse(query_params):
+        key = output_key(notebook_id, notebook, parameters, kernel_name)
+    return notebook, parameters, kernel_name, key
+
+
+def find_existing_output(
+    notebook_id: str, query_params: Mapping[str, str]
+) -> Optional[str]:
+    """
+    The output ID of an earlier identical run whose output still exists.
+
+    The run is validated first, so a bad request fails before a job is queued:
+    raises NotebookNotFoundError for an unknown notebook and ValueError for
+    invalid parameters.
+    """
+    notebook = get_notebook_config(notebook_id)
+    parameters = parse_parameters(
+        query_params, notebook.get("inputSpec", {}), strict=True
+    )
+    if not wants_reuse(query_params):
+        return None
+
+    try:
+        kernel_name = get_kernel_name(notebook)
+        key = output_key(notebook_id, notebook, parameters, kernel_name)
     except Exception as e:
-        logger.warning(f"Failed to detect kernel: {e}, using default python3")
-        return "python3"
+        # Let the queued run report the error
+        logger.debug(f"Can't look up existing output for {notebook_id}: {e}")
+        return None
+
+    output_path = get_output_path(notebook_id, key) if key else None
+    if output_path is None or not output_path.exists():
+        return None
+
+    output_retention.record_use(output_path)
+    _output_stats["reused"] += 1
+    notebook_outputs.inc(notebook_id=notebook_label(notebook_id), result="reused")
+    logger.info(f"Reusing output {key} for notebook {notebook_id}")
+    return key
 
 
-def execute_notebook(notebook_id: str, request: Request) -> str:
+def notebook_output_stats() -> Dict[str, Any]:
+    return {"reuse_enabled": NOTEBOOK_OUTPUT_REUSE, **_output_stats}
+
+
+def execute_notebook(
+    notebook_id: str,
+    query_params: Mapping[str, str],
+    progress: Optional[ProgressCallback] = None,
+) -> str:
     """
     Execute a notebook with the given ID and request parameters.
 
+    Runs with the same parameters against the same source notebook share one
+    output, unless the request passes reuse=false.
+
     Args:
         notebook_id: The ID of the notebook to execute
-        request: FastAPI request object containing query parameters
+        query_params: Request query parameters to parse against the notebook's inputSpec
+        progress: Optional callback receiving cell progress events while the
+            notebook executes
 
     Returns:
         str: The output notebook ID for viewing
     """
-    output_id = str(uuid.uuid4())
-    notebooks_dir = Path("notebooks")
-    notebooks_dir.mkdir(exist_ok=True)
-    output_path = notebooks_dir / f"{notebook_id}-{output_id}.ipynb"
-
-    try:
-        # Get notebook config and inputSpec
-        notebook = get_notebook_config(notebook_id)
-        input_spec = notebook.get("inputSpec", {})
+    with span("execute_notebook", **{"notebook.id": notebook_id}) as current:
+        notebook, parameters, kernel_name, key = _resolve_run(notebook_id, query_params)
+        output_id, reused = _write_output(
+            notebook_id, notebook, parameters, kernel_name, key, progress
+        )
+        current.set_attributes(
+            {"notebook.output_id": output_id, "notebook.reused": reused}
+        )
+        return output_id
 
-        # Extract and parse parameters
-        parameters = parse_parameters(request, input_spec)
 
-        # Get kernel name
-        kernel_name = get_default_kernel_name()
+def _write_output(
+    notebook_id: str,
+    notebook: Dict[str, Any],
+    parameters: Dict[str, Any],
+    kernel_name: str,
+    key: Optional[str],
+    progress: Optional[ProgressCallback] = None,
+) -> Tuple[str, bool]:
+    """Prepare or execute one run; returns (output_id, reused)."""
+    output_id = key or str(uuid.uuid4())
+    output_path = get_output_path(notebook_id, output_id)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if key is not None and output_path.exists():
+        output_retention.record_use(output_path)
+        _output_stats["reused"] += 1
+        notebook_outputs.inc(notebook_id=notebook_label(notebook_id), result="reused")
+        logger.info(f"Reusing output {output_id} for notebook {notebook_id}")
+        return output_id, True
+
+    # Written beside the output and renamed into place, so a reader never sees
+    # a partial notebook
+    tmp_path = output_path.with_name(f".{uuid.uuid4().hex}-{output_path.name}")
+    label = notebook_label(notebook_id)
+    mode = NOTEBOOK_EXECUTION_MODE
+    start = time.perf_counter()
 
+    try:
         # Execute notebook
-        pm.execute_notebook(
-            notebook["file"],
-            str(output_path),
-            parameters=parameters,
-            prepare_only=True,
-            kernel_name=kernel_name,
+        if NOTEBOOK_EXECUTION_MODE == "execute":
+            with (
+                get_kernel_pool(kernel_name).kernel() as km,
+                span("papermill.execute_notebook", kernel=kernel_name),
+            ):
+                nb = pm.execute_notebook(
+                    notebook["file"],
+                    str(tmp_path),
+                    parameters=parameters,
+                    kernel_name=kernel_name,
+                    engine_name=POOLED_ENGINE_NAME,
+                    km=km,
+                    progress_bar=False,
+                    execution_timeout=NOTEBOOK_EXECUTION_TIMEOUT,
+                    progress_callback=progress,
+                )
+            _record_profile(notebook_id, output_id, output_path, kernel_name, nb)
+        elif NOTEBOOK_FAST_PREPARE and supports_fast_prepare(notebook["file"]):
+            mode = "fast_prepare"
+            with span("prepare_notebook"):
+                prepare_notebook(
+                    notebook["file"],
+                    str(output_path),
+                    parameters,
+                    kernel_name,
+                    write_path=str(tmp_path),
+                )
+        else:
+            with span("papermill.execute_notebook", prepare_only=True):
+                pm.execute_notebook(
+                    notebook["file"],
+                    str(tmp_path),
+                    parameters=parameters,
+                    prepare_only=True,
+                    kernel_name=kernel_name,
+                )
+        os.replace(tmp_path, output_path)
+        output_retention.record_use(output_path)
+
+        notebook_run_seconds.observe(
+            time.perf_counter() - start, notebook_id=label, mode=mode
         )
-
+        notebook_outputs.inc(notebook_id=label, result="created")
+        _output_stats["created"] += 1
         logger.info(
             f"Notebook {notebook_id} executed successfully with output {output_id}"
         )
-        return output_id
+        return output_id, False
+
+    except PapermillExecutionError as e:
+        notebook_outputs.inc(notebook_id=label, result="failed")
+        message = f"Cell {e.exec_count} raised {e.ename}: {e.evalue}"
+        logger.error(f"Notebook {notebook_id} execution failed: {message}")
+        if not tmp_path.exists():
+            raise NotebookExecutionError(message, None) from e
+
+        # Keep the partially run notebook, as papermill does, under its own ID so
+        # it's never reused as the output of a successful run
+        failed_id = str(uuid.uuid4())
+        failed_path = get_output_path(notebook_id, failed_id)
+        failed_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, failed_path)
+        output_retention.record_use(failed_path)
+        logger.info(f"Kept failed output {failed_id} for notebook {notebook_id}")
+        raise NotebookExecutionError(message, failed_id) from e
 
     except Exception as e:
+        notebook_outputs.inc(notebook_id=label, result="failed")
         # Clean up failed output file
-        if output_path.exists():
-            output_path.unlink()
-            logger.info(f"Cleaned up failed output file: {output_path}")
+        if tmp_path.exists():
+            tmp_path.unlink()
+            logger.info(f"Cleaned up failed output file: {tmp_path}")
         logger.error(f"Notebook execution failed: {e}")
         raise
 
 
+def _record_profile(
+    notebook_id: str,
+    output_id: str,
+    output_path: Path,
+    kernel_name: str,
+    nb: Any,
+) -> None:
+    """Write an executed run's cell profiles to a sidecar and the profile store."""
+    cells = cell_profiles(nb)
+    if not cells:
+        return
+
+    run = {
+        "notebook_id": notebook_id,
+        "output_id": output_id,
+        "kernel_name": kernel_name,
+        "finished_at": time.time(),
+        "cells": cells,
+    }
+    try:
+        profile_path(output_path).write_text(json.dumps(run, indent=1))
+    except OSError as e:
+        logger.warning(f"Failed to write profile for output {output_id}: {e}")
+    profile_store.add(notebook_id, run)
+
+
+def notebook_profile(notebook_id: str, last: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Percentiles of the recorded cell profiles of a notebook's runs. "profiling"
+    says whether new runs are being profiled at all.
+    """
+    profile_store.load(notebook_id, _profile_sidecars(notebook_id))
+    return {
+        **profile_store.report(notebook_id, last),
+        "profiling": NOTEBOOK_PROFILE_CELLS and NOTEBOOK_EXECUTION_MODE == "execute",
+    }
+
+
+def _profile_sidecars(notebook_id: str) -> List[Path]:
+    pattern = f"{notebook_id}-*{PROFILE_SUFFIX}"
+    if NOTEBOOK_OUTPUT_LAYOUT == "sharded":
+        candidates = (NOTEBOOKS_DIR / notebook_id).glob(f"*/{pattern}")
+    else:
+        candidates = NOTEBOOKS_DIR.glob(pattern)
+
+    # "ndvi-*" also matches outputs of a notebook called "ndvi-extra"
+    name_re = re.compile(
+        re.escape(notebook_id) + "-" + OUTPUT_ID_PATTERN + re.escape(PROFILE_SUFFIX)
+    )
+    return [path for path in candidates if name_re.fullmatch(path.name)]
+
+
+def expand_parameter_sets(
+    parameter_sets: List[Dict[str, str]],
+    sweep: Dict[str, List[str]],
+    input_spec: Dict[str, str],
+) -> List[Dict[str, str]]:
+    """
+    Combine explicit parameter sets with a cartesian sweep over inputSpec keys.
+
+    Every combination of the sweep values is applied on top of every parameter
+    set, so a single set of shared parameters can be swept over bboxes.
+    """
+    if not parameter_sets and not sweep:
+        raise ValueError("A batch needs at least one parameter set or sweep")
+
+    unknown = sorted(set(sweep) - set(input_spec))
+    if unknown:
+        raise ValueError(f"Sweep parameters not in inputSpec: {', '.join(unknown)}")
+
+    runs = [dict(parameter_set) for parameter_set in parameter_sets] or [{}]
+    if sweep:
+        names = list(sweep)
+        combinations = list(itertools.product(*(sweep[name] for name in names)))
+        runs = [
+            {**run, **dict(zip(names, values))}
+            for run in runs
+            for values in combinations
+        ]
+
+    if len(runs) > NOTEBOOK_BATCH_MAX_SIZE:
+        raise ValueError(
+            f"A batch can contain at most {NOTEBOOK_BATCH_MAX_SIZE} runs, "
+            f"got {len(runs)}"
+        )
+    return runs
+
+
+@traced()
+def plan_notebook_batch(
+    notebook_id: str,
+    parameter_sets: List[Dict[str, str]],
+    sweep: Optional[Dict[str, List[str]]] = None,
+    reuse: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Expand a batch into its runs, validated against the notebook's inputSpec
+    before anything is queued: raises ValueError for unknown parameter names or
+    values that don't parse.
+
+    Each run is returned with its query parameters, the output ID it will write
+    (None when outputs aren't keyed, e.g. with reuse off) and whether that
+    output already exists and will be reused.
+    """
+    notebook = get_notebook_config(notebook_id)
+    input_spec = notebook.get("inputSpec", {})
+    for parameter_set in parameter_sets:
+        unknown = sorted(set(parameter_set) - set(input_spec) - {REUSE_QUERY_PARAM})
+        if unknown:
+            raise ValueError(f"Parameters not in inputSpec: {', '.join(unknown)}")
+
+    runs = expand_parameter_sets(parameter_sets, sweep or {}, input_spec)
+    kernel_name = get_kernel_name(notebook) if reuse else None
+    plans = []
+    for query_params in runs:
+        parameters = parse_parameters(query_params, input_spec, strict=True)
+        if not reuse:
+            query_params[REUSE_QUERY_PARAM] = "false"
+
+        key = None
+        if wants_reuse(query_params):
+            key = output_key(notebook_id, notebook, parameters, kernel_name)
+        reused = key is not None and get_output_path(notebook_id, key).exists()
+        plans.append({"parameters": query_params, "output_id": key, "reused": reused})
+    return plans
+
+
+def warm_kernel_pool() -> None:
+    """Pre-start the default kernel's pool when notebooks are really executed."""
+    if NOTEBOOK_EXECUTION_MODE == "execute":
+        get_kernel_pool(get_default_kernel_name()).fill()
+
+
 def get_view_notebook_url(notebook_id: str, output_id: str) -> str:
     """Generate the URL for viewing a notebook with configurable base URL."""
     # This should be configurable via environment variables
     jupyter_base_url = os.getenv("JUPYTER_BASE_URL", "http://localhost:8889")
-    return f"{jupyter_base_url}/lab/tree/{notebook_id}-{output_id}.ipynb"
+    return f"{jupyter_base_url}/lab/tree/{get_output_relpath(notebook_id, output_id)}"
@@ -0,0 +1,79 @@
+import pytest
+
+COG_URL = "https://example.com/S2A_T30UXC_20240601/B04.tif"
+
+
+@pytest.fixture
+def cog_url():
+    return COG_URL
+
+
+@pytest.fixture
+def asset_level_item():
+    """A Sentinel-2 style item with the projection fields on each asset."""
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "id": "S2A_T30UXC_20240601",
+        "properties": {"datetime": "2024-06-01T11:06:21Z"},
+        "assets": {
+            "red": {
+                "href": COG_URL,
+                "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+                "proj:epsg": 32630,
+                "proj:shape": [10980, 10980],
+                "proj:bbox": [600000.0, 5690220.0, 709800.0, 5800020.0],
+                "proj:transform": [10.0, 0.0, 600000.0, 0.0, -10.0, 5800020.0],
+                "raster:bands": [{"data_type": "uint16", "nodata": 0}],
+            },
+            "scl": {
+                "href": "https://example.com/S2A_T30UXC_20240601/SCL.tif",
+                "proj:epsg": 32630,
+                "proj:shape": [5490, 5490],
+                "proj:bbox": [600000.0, 5690220.0, 709800.0, 5800020.0],
+                "raster:bands": [{"data_type": "uint8"}],
+            },
+        },
+    }
+
+
+@pytest.fixture
+def item_level_item():
+    """An item with the projection fields in its properties only."""
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "id": "LC09_L2SP_203023_20240601",
+        "properties": {
+            "datetime": "2024-06-01T11:00:00Z",
+            "proj:epsg": 32630,
+            "proj:shape": [7801, 7681],
+            "proj:transform": [30.0, 0.0, 499785.0, 0.0, -30.0, 6000015.0],
+        },
+        "assets": {
+            "red": {
+                "href": COG_URL,
+                "eo:bands": [{"name": "SR_B4"}],
+            },
+        },
+    }
+
+
+@pytest.fixture
+def bbox_3d_item():
+    """An item whose proj:bbox carries heights: minx, miny, minz, maxx, maxy, maxz."""
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "id": "dem_tile",
+        "properties": {"datetime": "2024-06-01T00:00:00Z"},
+        "assets": {
+            "dem": {
+                "href": COG_URL,
+                "proj:code": "EPSG:27700",
+                "proj:shape": [1000, 2000],
+                "proj:bbox": [400000.0, 300000.0, -5.0, 420000.0, 310000.0, 950.0],
+                "raster:bands": [{"data_type": "float32"}],
+            },
+        },
+    }
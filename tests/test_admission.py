@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import admission
+from admission import AdmissionBudget, AdmissionMiddleware, AdmissionRejected
+
+
+def test_rejects_when_the_wait_queue_is_full():
+    async def scenario():
+        budget = AdmissionBudget("test", concurrency=1, max_queue=1, max_wait=5)
+        assert await budget.acquire() == 0.0
+        waiter = asyncio.ensure_future(budget.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await budget.acquire()
+
+        budget.release(0.1)
+        assert await waiter >= 0
+        return budget, rejected.value
+
+    budget, rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "queue_full"
+    # No hold times were known yet, so clients are asked to wait max_wait
+    assert rejected.retry_after == 5
+    assert budget.rejected["queue_full"] == 1
+    assert budget.stats()["active"] == 1
+    assert budget.stats()["admitted"] == 2
+
+
+def test_rejects_when_the_expected_wait_is_too_long():
+    async def scenario():
+        budget = AdmissionBudget("test", concurrency=1, max_queue=10, max_wait=1)
+        await budget.acquire()
+        # Requests have been holding the slot for 3s on average
+        budget.release(3)
+        await budget.acquire()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await budget.acquire()
+        return budget, rejected.value
+
+    budget, rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "expected_wait"
+    assert rejected.retry_after == 3
+    assert budget.stats()["waiting"] == 0
+
+
+def test_rejects_a_waiter_after_max_wait():
+    async def scenario():
+        budget = AdmissionBudget("test", concurrency=1, max_queue=10, max_wait=0.05)
+        await budget.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await budget.acquire()
+        return budget, rejected.value
+
+    budget, rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "timeout"
+    assert budget.stats()["waiting"] == 0
+    assert budget.stats()["active"] == 1
+
+
+def test_slots_are_handed_to_waiters_in_arrival_order():
+    async def scenario():
+        budget = AdmissionBudget("test", concurrency=1, max_queue=10, max_wait=5)
+        order = []
+
+        async def request(name):
+            await budget.acquire()
+            order.append(name)
+            await asyncio.sleep(0)
+            budget.release()
+
+        await budget.acquire()
+        tasks = [asyncio.ensure_future(request(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        budget.release()
+        await asyncio.gather(*tasks)
+        return budget, order
+
+    budget, order = asyncio.run(scenario())
+
+    assert order == ["a", "b", "c"]
+    assert budget.stats()["active"] == 0
+
+
+@pytest.fixture
+def saturated_app(monkeypatch):
+    budget = AdmissionBudget("qlr", concurrency=1, max_queue=0, max_wait=2)
+    asyncio.run(budget.acquire())
+    monkeypatch.setitem(admission.admission_budgets, "qlr", budget)
+
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, enabled=True)
+
+    @app.get("/qlr")
+    async def qlr():
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    return TestClient(app), budget
+
+
+@pytest.mark.parametrize("status_code", [503, 429])
+def test_middleware_rejects_with_retry_after(saturated_app, monkeypatch, status_code):
+    monkeypatch.setattr(admission, "ADMISSION_REJECT_STATUS", status_code)
+    client, budget = saturated_app
+
+    response = client.get("/qlr")
+
+    assert response.status_code == status_code
+    assert response.headers["retry-after"] == "2"
+    assert response.json() == {"detail": "qlr is overloaded (queue_full)"}
+    assert client.get("/health").status_code == 200
+
+    budget.release()
+    assert client.get("/qlr").status_code == 200
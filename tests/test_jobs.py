@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from run_notebook.jobs import JobManager, JobStatus, QueueFullError
+from run_notebook.run_notebook import NotebookExecutionError
+
+
+class BlockingRuns:
+    """A run callable whose runs wait until released, recording which ran."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+        self._lock = threading.Lock()
+
+    def __call__(self, notebook_id, query_params, progress=None):
+        with self._lock:
+            self.started.append(query_params["x"])
+        if not self.release.wait(5):
+            raise RuntimeError("run was never released")
+        if query_params.get("fail") == "cell":
+            raise NotebookExecutionError("Cell 2 raised KeyError: 'band'", "kept-id")
+        if query_params.get("fail") == "params":
+            raise ValueError("Invalid bbox format for bbox: 1,2")
+        if query_params.get("fail") == "crash":
+            raise RuntimeError("kernel died")
+        return f"out-{query_params['x']}"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def runs():
+    runs = BlockingRuns()
+    yield runs
+    runs.release.set()
+
+
+def test_per_notebook_limit_lets_other_notebooks_overtake(runs):
+    manager = JobManager(runs, workers=3, max_queue=10, per_notebook_limit=1)
+    busy = [manager.submit("busy", {"x": f"busy{i}"}) for i in range(3)]
+    other = manager.submit("other", {"x": "other"})
+
+    wait_for(lambda: len(runs.started) == 2)
+    assert sorted(runs.started) == ["busy0", "other"]
+    stats = manager.stats()
+    assert stats["running_by_notebook"] == {"busy": 1, "other": 1}
+    assert stats["queue_depth"] == 2
+    assert [job.status for job in busy] == [
+        JobStatus.RUNNING,
+        JobStatus.QUEUED,
+        JobStatus.QUEUED,
+    ]
+
+    runs.release.set()
+    wait_for(lambda: all(job.finished for job in busy + [other]))
+    assert runs.started[2:] == ["busy1", "busy2"]
+    assert manager.get(busy[2].id).output_id == "out-busy2"
+    manager.shutdown()
+
+
+def test_submit_batch_is_all_or_nothing(runs):
+    manager = JobManager(runs, workers=0, max_queue=3)
+    manager.submit("nb", {"x": "single"})
+
+    with pytest.raises(QueueFullError):
+        manager.submit_batch("nb", [{"x": "a"}, {"x": "b"}, {"x": "c"}])
+
+    stats = manager.stats()
+    assert stats["queue_depth"] == 1
+    assert stats["submitted"] == 1
+    assert stats["rejected"] == 1
+
+    batch = manager.submit_batch("nb", [{"x": "a"}, {"x": "b"}])
+    assert manager.get_batch(batch.id) is batch
+    assert [manager.get(job.id).query_params for job in batch.jobs] == [
+        {"x": "a"},
+        {"x": "b"},
+    ]
+    assert batch.to_dict()["queued"] == 2
+    assert manager.stats()["queue_depth"] == 3
+
+
+def test_failed_runs_report_their_error(runs):
+    manager = JobManager(runs, workers=3, max_queue=10, per_notebook_limit=3)
+    cell = manager.submit("nb", {"x": "1", "fail": "cell"})
+    params = manager.submit("nb", {"x": "2", "fail": "params"})
+    crash = manager.submit("nb", {"x": "3", "fail": "crash"})
+    runs.release.set()
+    wait_for(lambda: cell.finished and params.finished and crash.finished)
+
+    assert cell.status == JobStatus.FAILED
+    assert cell.error == "Cell 2 raised KeyError: 'band'"
+    assert cell.output_id == "kept-id"
+    assert params.error == "Invalid bbox format for bbox: 1,2"
+    assert params.output_id is None
+    assert crash.error == "Internal server error"
+    assert manager.stats()["failed"] == 3
+    manager.shutdown()
@@ -0,0 +1,90 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+parser = pytest.importorskip("prometheus_client.parser")
+
+
+def parse(text):
+    return {
+        family.name: family for family in parser.text_string_to_metric_families(text)
+    }
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    counter = registry.register(Counter("jobs", "Jobs run", ["result"]))
+    counter.inc(result="ok")
+    counter.inc(2, result="error")
+    registry.register(Gauge("queue_depth", "Jobs waiting")).set(3)
+    registry.register(
+        Histogram("duration_seconds", "Job time", buckets=(1, 5))
+    ).observe(2)
+    registry.register_stats(
+        lambda: {
+            "executor": {"submitted": 7, "queue_depth": 2, "enabled": True},
+            "kernel_pools": [
+                {"kernel": "python3", "started": 4, "idle": 1},
+                {"kernel": "r", "started": 1, "idle": 0},
+            ],
+            "config": {"nested": {"ignored": 1}, "source": "url"},
+        }
+    )
+    return registry
+
+
+def test_registry_output_parses_as_prometheus_text(registry):
+    families = parse(registry.render())
+
+    jobs = families["eodh_jobs"]
+    assert jobs.type == "counter"
+    assert jobs.documentation == "Jobs run"
+    assert {
+        (sample.name, sample.labels["result"], sample.value) for sample in jobs.samples
+    } == {("eodh_jobs_total", "ok", 1), ("eodh_jobs_total", "error", 2)}
+
+    assert families["eodh_queue_depth"].type == "gauge"
+    histogram = families["eodh_duration_seconds"]
+    assert histogram.type == "histogram"
+    assert {sample.name for sample in histogram.samples} == {
+        "eodh_duration_seconds_bucket",
+        "eodh_duration_seconds_count",
+        "eodh_duration_seconds_sum",
+    }
+
+
+def test_stats_counters_and_gauges_parse_with_matching_family_names(registry):
+    families = parse(registry.render())
+
+    submitted = families["eodh_executor_submitted"]
+    assert submitted.type == "counter"
+    assert [(s.name, s.value) for s in submitted.samples] == [
+        ("eodh_executor_submitted_total", 7)
+    ]
+    assert families["eodh_executor_queue_depth"].type == "gauge"
+    assert families["eodh_executor_enabled"].samples[0].value == 1
+
+    started = families["eodh_kernel_pools_started"]
+    assert started.type == "counter"
+    assert {s.labels["kernel"]: s.value for s in started.samples} == {
+        "python3": 4,
+        "r": 1,
+    }
+    assert not any(name.startswith("eodh_config") for name in families)
+
+
+def test_metrics_endpoint_parses_as_prometheus_text():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    response = TestClient(main.app).get("/metrics")
+
+    assert response.status_code == 200
+    families = parse(response.text)
+    assert families["eodh_http_request_duration_seconds"].type == "histogram"
+    assert families["eodh_cog_metadata_cache_hits"].type == "counter"
+    assert families["eodh_cog_metadata_cache_hits"].samples[0].name == (
+        "eodh_cog_metadata_cache_hits_total"
+    )
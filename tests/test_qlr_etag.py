@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from create_qlr.create_qlr import cached_qlr_etag, normalize_url, qlr_etag
+from create_qlr.get_template import template_registry
+from create_qlr.metadata_cache import cog_metadata_cache
+from create_qlr.stac import metadata_from_stac
+
+COLLECTION = "sentinel2_ard"
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def cached_metadata(asset_level_item, cog_url):
+    # Seeds the metadata cache, so nothing here reads the COG over the network
+    metadata = metadata_from_stac(asset_level_item, cog_url)
+    key = normalize_url(cog_url)
+    cog_metadata_cache.put(key, metadata)
+    yield metadata
+    cog_metadata_cache.invalidate(key)
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ("*", True),
+        ('"xyz"', False),
+        ("abc", False),
+    ],
+)
+def test_etag_matches(if_none_match, matches):
+    assert main.etag_matches(if_none_match, '"abc"') is matches
+
+
+def test_qlr_etag_covers_the_rendered_inputs(cached_metadata, cog_url):
+    etag = qlr_etag(cached_metadata, cog_url, COLLECTION, "B04.tif")
+
+    assert etag == qlr_etag(dict(cached_metadata), cog_url, COLLECTION, "B04.tif")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag != qlr_etag(cached_metadata, cog_url, "sentinel1_ard", "B04.tif")
+    assert etag != qlr_etag(cached_metadata, cog_url, COLLECTION, "other")
+    assert etag != qlr_etag(
+        cached_metadata, cog_url, COLLECTION, "B04.tif", template_version="v2"
+    )
+
+
+def test_cached_etag_needs_cached_metadata(cached_metadata, cog_url):
+    assert cached_qlr_etag(cog_url, COLLECTION) == qlr_etag(
+        cached_metadata, cog_url, COLLECTION, "B04.tif"
+    )
+    assert cached_qlr_etag(cog_url, "unknown_collection") is None
+    assert cached_qlr_etag("https://example.com/uncached.tif", COLLECTION) is None
+
+
+def test_qlr_from_stac_item_revalidates_with_304(client, asset_level_item, cog_url):
+    params = {
+        "url": cog_url,
+        "collection": COLLECTION,
+        "stac_item": json.dumps(asset_level_item),
+    }
+    response = client.get("/qlr", params=params)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}'):
+        response = client.get(
+            "/qlr", params=params, headers={"If-None-Match": if_none_match}
+        )
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    response = client.get("/qlr", params=params, headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_cached_qlr_revalidates_without_building(
+    client, cached_metadata, cog_url, monkeypatch
+):
+    # A due template reload check would send the request down the build path
+    monkeypatch.setattr(template_registry, "reload_interval", 3600)
+    params = {"url": cog_url, "collection": COLLECTION}
+    etag = client.get("/qlr", params=params).headers["etag"]
+
+    def not_called(*args, **kwargs):
+        raise AssertionError("build_qlr called on the 304 fast path")
+
+    monkeypatch.setattr(main, "build_qlr", not_called)
+    response = client.get("/qlr", params=params, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
@@ -0,0 +1,108 @@
+import time
+
+import nbformat
+import pytest
+
+import run_notebook.run_notebook as rn
+
+
+def write_notebook(path, source="print(x)"):
+    parameters = nbformat.v4.new_code_cell("x = 'a'\nbbox = None")
+    parameters.metadata["tags"] = ["parameters"]
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells = [parameters, nbformat.v4.new_code_cell(source)]
+    notebook.metadata["kernelspec"] = {"name": "python3", "language": "python"}
+    nbformat.write(notebook, str(path))
+
+
+@pytest.fixture
+def notebook(tmp_path, monkeypatch):
+    source = tmp_path / "source.ipynb"
+    write_notebook(source)
+    config = {
+        "id": "nb1",
+        "file": str(source),
+        "inputSpec": {"x": "string", "bbox": "bbox"},
+    }
+    monkeypatch.setitem(rn._config_cache, "data", [config])
+    monkeypatch.setitem(rn._config_cache, "timestamp", time.time())
+    monkeypatch.setitem(rn._config_cache, "index", {("notebook", "nb1"): config})
+    monkeypatch.setattr(rn, "NOTEBOOKS_DIR", tmp_path / "notebooks")
+    monkeypatch.setattr(rn, "NOTEBOOK_OUTPUT_REUSE", True)
+    rn.source_notebooks.clear()
+    return config
+
+
+def key_for(notebook, query_params):
+    parameters = rn.parse_parameters(query_params, notebook["inputSpec"])
+    kernel_name = rn.get_kernel_name(notebook)
+    return rn.output_key("nb1", notebook, parameters, kernel_name)
+
+
+def test_output_key_is_deterministic(notebook):
+    key = key_for(notebook, {"x": "a", "bbox": "1,2,3,4"})
+
+    assert key == key_for(notebook, {"bbox": "1,2,3,4", "x": "a"})
+    assert key == key_for(notebook, {"x": "a", "bbox": "1.0, 2, 3, 4.0"})
+    assert key != key_for(notebook, {"x": "b", "bbox": "1,2,3,4"})
+    assert key != key_for(notebook, {"x": "a"})
+
+
+def test_output_key_changes_with_the_source_notebook(notebook):
+    key = key_for(notebook, {"x": "a"})
+
+    write_notebook(notebook["file"], source="print(x * 2)")
+    rn.source_notebooks.clear()
+
+    assert key_for(notebook, {"x": "a"}) != key
+
+
+def test_existing_output_is_reused(notebook):
+    query_params = {"x": "a"}
+    assert rn.find_existing_output("nb1", query_params) is None
+
+    key = key_for(notebook, query_params)
+    output_path = rn.get_output_path("nb1", key)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text("{}")
+
+    assert rn.find_existing_output("nb1", query_params) == key
+    assert rn.find_existing_output("nb1", {"x": "a", "reuse": "false"}) is None
+    assert rn.find_existing_output("nb1", {"x": "b"}) is None
+
+
+def test_invalid_runs_are_rejected_before_lookup(notebook):
+    with pytest.raises(rn.NotebookNotFoundError):
+        rn.find_existing_output("missing", {})
+    with pytest.raises(ValueError, match="Invalid bbox format"):
+        rn.find_existing_output("nb1", {"bbox": "1,2,x,4"})
+
+
+def test_batch_plan_lists_output_ids(notebook):
+    existing = key_for(notebook, {"x": "a"})
+    output_path = rn.get_output_path("nb1", existing)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text("{}")
+
+    plans = rn.plan_notebook_batch("nb1", [], sweep={"x": ["a", "b"]})
+
+    assert [plan["parameters"] for plan in plans] == [{"x": "a"}, {"x": "b"}]
+    assert [plan["output_id"] for plan in plans] == [
+        existing,
+        key_for(notebook, {"x": "b"}),
+    ]
+    assert [plan["reused"] for plan in plans] == [True, False]
+
+    plans = rn.plan_notebook_batch("nb1", [{"x": "a"}], reuse=False)
+    assert plans == [
+        {"parameters": {"x": "a", "reuse": "false"}, "output_id": None, "reused": False}
+    ]
+
+
+def test_batch_plan_rejects_unknown_and_invalid_parameters(notebook):
+    with pytest.raises(ValueError, match="Parameters not in inputSpec: y"):
+        rn.plan_notebook_batch("nb1", [{"x": "a"}, {"y": "b"}])
+    with pytest.raises(ValueError, match="Sweep parameters not in inputSpec: y"):
+        rn.plan_notebook_batch("nb1", [], sweep={"y": ["a"]})
+    with pytest.raises(ValueError, match="Invalid bbox format"):
+        rn.plan_notebook_batch("nb1", [{"bbox": "1,2,3"}])
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from create_qlr.singleflight import SingleFlight
+
+
+def test_concurrent_calls_for_a_key_share_one_execution():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load(key):
+        calls.append(key)
+        if key == "a":
+            started.set()
+            release.wait(5)
+        return {"key": key}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(flights.do, "a", load, "a")
+        assert started.wait(5)
+        followers = [pool.submit(flights.do, "a", load, "a") for _ in range(3)]
+        other = pool.submit(flights.do, "b", load, "b")
+        assert other.result(5) == {"key": "b"}
+        while flights.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert calls == ["a", "b"]
+    assert all(result is results[0] for result in results)
+    assert flights.stats() == {"in_flight": 0, "executions": 2, "coalesced": 3}
+
+
+def test_waiters_receive_the_leaders_error():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("unreadable COG")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flights.do, "a", fail)
+        assert started.wait(5)
+        follower = pool.submit(flights.do, "a", fail)
+        while flights.stats()["coalesced"] < 1:
+            time.sleep(0.01)
+        release.set()
+
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="unreadable COG"):
+                future.result(5)
+
+    assert flights.stats()["executions"] == 1
+
+
+def test_key_is_released_after_each_call():
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flights.do("a", fail)
+
+    assert flights.do("a", lambda: 1) == 1
+    assert flights.do("a", lambda: 2) == 2
+    assert flights.stats() == {"in_flight": 0, "executions": 3, "coalesced": 0}
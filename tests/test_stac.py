@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from create_qlr.stac import find_asset, load_stac_item, metadata_from_stac
+
+
+def test_reads_projection_fields_of_matching_asset(asset_level_item, cog_url):
+    metadata = metadata_from_stac(asset_level_item, cog_url)
+
+    assert tuple(metadata["extent"]) == (600000.0, 5690220.0, 709800.0, 5800020.0)
+    assert metadata["crs_epsg"] == 32630
+    assert "UTM zone 30N" in metadata["crs_wkt"]
+    assert metadata["width"] == 10980
+    assert metadata["height"] == 10980
+    assert metadata["count"] == 1
+    assert metadata["dtype"] == "uint16"
+    west, south, east, north = metadata["wgs84_extent"]
+    assert -1.8 < west < east < 0.2
+    assert 51.3 < south < north < 52.4
+
+
+def test_matches_asset_by_href(asset_level_item, cog_url):
+    assert find_asset(asset_level_item, cog_url) is asset_level_item["assets"]["red"]
+    assert find_asset(asset_level_item, f"  {cog_url}") is None
+
+    scl_url = asset_level_item["assets"]["scl"]["href"]
+    metadata = metadata_from_stac(asset_level_item, scl_url)
+    assert metadata["width"] == 5490
+    assert metadata["dtype"] == "uint8"
+
+
+def test_unmatched_url_only_sees_item_properties(asset_level_item):
+    # The projection fields are only on the assets
+    assert metadata_from_stac(asset_level_item, "https://example.com/other.tif") is None
+
+
+def test_falls_back_to_item_level_properties(item_level_item, cog_url):
+    metadata = metadata_from_stac(item_level_item, cog_url)
+
+    # Extent derived from proj:transform and proj:shape
+    assert tuple(metadata["extent"]) == (499785.0, 5765985.0, 730215.0, 6000015.0)
+    assert metadata["crs_epsg"] == 32630
+    assert metadata["width"] == 7681
+    assert metadata["height"] == 7801
+    assert metadata["count"] == 1
+    assert metadata["dtype"] is None
+
+
+def test_asset_fields_take_precedence_over_properties(item_level_item, cog_url):
+    item_level_item["assets"]["red"]["proj:shape"] = [100, 200]
+    item_level_item["assets"]["red"]["proj:bbox"] = [500000, 5900000, 506000, 5903000]
+
+    metadata = metadata_from_stac(item_level_item, cog_url)
+
+    assert tuple(metadata["extent"]) == (500000, 5900000, 506000, 5903000)
+    assert (metadata["width"], metadata["height"]) == (200, 100)
+
+
+def test_3d_bbox_drops_heights(bbox_3d_item, cog_url):
+    metadata = metadata_from_stac(bbox_3d_item, cog_url)
+
+    assert tuple(metadata["extent"]) == (400000.0, 300000.0, 420000.0, 310000.0)
+    assert metadata["crs_epsg"] == 27700
+    assert (metadata["width"], metadata["height"]) == (2000, 1000)
+    assert metadata["dtype"] == "float32"
+
+
+@pytest.mark.parametrize("field", ["proj:epsg", "proj:shape", "proj:bbox"])
+def test_missing_projection_field_returns_none(asset_level_item, cog_url, field):
+    asset = asset_level_item["assets"]["red"]
+    del asset[field]
+    if field == "proj:bbox":
+        del asset["proj:transform"]
+
+    assert metadata_from_stac(asset_level_item, cog_url) is None
+
+
+def test_load_stac_item_accepts_dict_json_and_path(asset_level_item, tmp_path):
+    path = tmp_path / "item.json"
+    path.write_text(json.dumps(asset_level_item))
+
+    assert load_stac_item(asset_level_item) is asset_level_item
+    assert load_stac_item(json.dumps(asset_level_item)) == asset_level_item
+    assert load_stac_item(path) == asset_level_item
+    assert load_stac_item(str(path)) == asset_level_item
+
+
+def test_load_stac_item_rejects_invalid_input(tmp_path):
+    with pytest.raises(ValueError, match="Invalid STAC item: Expecting"):
+        load_stac_item("{not json")
+    with pytest.raises(ValueError, match="No such file"):
+        load_stac_item(str(tmp_path / "missing.json"))
+
+    not_an_object = tmp_path / "list.json"
+    not_an_object.write_text("[1, 2]")
+    with pytest.raises(ValueError, match="expected a JSON object"):
+        load_stac_item(str(not_an_object))
@@ -0,0 +1,211 @@
+"""
+Optional OpenTelemetry tracing.
+
+Spans are only recorded when TRACING_ENABLED is set and opentelemetry-sdk is
+installed (plus opentelemetry-exporter-otlp-proto-http for the otlp exporter).
+Otherwise span() hands out a shared no-op span, so instrumented code costs a
+function call.
+"""
+
+import functools
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# "console" prints spans to stdout, "file" appends one JSON span per line to
+# TRACING_FILE, "otlp" sends them to OTEL_EXPORTER_OTLP_ENDPOINT
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "console").lower()
+TRACING_EXPORTERS = ("console", "file", "otlp")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "eodh-notebook-orchestrator")
+
+_tracer: Any = None
+_provider: Any = None
+_output: Any = None
+_lock = threading.Lock()
+
+
+class NoopSpan:
+    """Stands in for a span when tracing is off."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def update_name(self, name: str) -> None:
+        pass
+
+
+_NOOP_SPAN = NoopSpan()
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def configure_tracing() -> bool:
+    """Set up the tracer and exporter once; returns whether tracing is on."""
+    global _tracer, _provider, _output
+    if not TRACING_ENABLED:
+        return False
+
+    with _lock:
+        if _tracer is not None:
+            return True
+
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import (
+                BatchSpanProcessor,
+                ConsoleSpanExporter,
+            )
+        except ImportError:
+            logger.warning(
+                "TRACING_ENABLED is set but opentelemetry-sdk isn't installed"
+            )
+            return False
+
+        if TRACING_EXPORTER == "console":
+            exporter = ConsoleSpanExporter()
+        elif TRACING_EXPORTER == "file":
+            _output = open(TRACING_FILE, "a", encoding="utf-8")
+            exporter = ConsoleSpanExporter(
+                out=_output, formatter=lambda span: span.to_json(indent=None) + "\n"
+            )
+        elif TRACING_EXPORTER == "otlp":
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                    OTLPSpanExporter,
+                )
+            except ImportError:
+                logger.warning(
+                    "TRACING_EXPORTER=otlp needs "
+                    "opentelemetry-exporter-otlp-proto-http"
+                )
+                return False
+            exporter = OTLPSpanExporter()
+        else:
+            logger.warning(
+                f"Unknown TRACING_EXPORTER '{TRACING_EXPORTER}', expected one of "
+                f"{', '.join(TRACING_EXPORTERS)}"
+            )
+            return False
+
+        _provider = TracerProvider(
+            resource=Resource.create({"service.name": TRACING_SERVICE_NAME})
+        )
+        _provider.add_span_processor(BatchSpanProcessor(exporter))
+        _tracer = _provider.get_tracer(__name__)
+
+    logger.info(f"Tracing enabled with the {TRACING_EXPORTER} exporter")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush buffered spans and stop exporting."""
+    global _tracer, _provider, _output
+    with _lock:
+        provider, _provider, _tracer = _provider, None, None
+        output, _output = _output, None
+    if provider is not None:
+        provider.shutdown()
+    if output is not None:
+        output.close()
+
+
+def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    # OpenTelemetry rejects None values
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Record the block as a span, a child of the current span. Exceptions
+    raised in the block are recorded on the span.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    with tracer.start_as_current_span(
+        name, attributes=_attributes(attributes)
+    ) as current:
+        yield current
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator recording each call of a function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware recording a server span per request, continuing the trace
+    of an incoming traceparent header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        tracer = _tracer
+        if scope["type"] != "http" or tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        from opentelemetry import propagate
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        method = scope["method"]
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as current:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = route_label(scope)
+                current.update_name(f"{method} {route}")
+                current.set_attribute("http.route", route)
+                current.set_attribute("http.response.status_code", status_code or 500)
+                if status_code is None or status_code >= 500:
+                    current.set_status(Status(StatusCode.ERROR))